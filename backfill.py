@@ -0,0 +1,221 @@
+"""Offline XP backfill: replay a historical message export through Aetherius' XP rules.
+
+The export is JSON lines, one message per line:
+
+    {"author_id": 123, "author_name": "Lyra#0001", "channel_id": 456, "timestamp": "2021-05-01T12:00:00+00:00"}
+
+`author`/`channel` are accepted as aliases, `timestamp` may be ISO-8601 or epoch
+seconds, and lines with `"bot": true` are skipped. XP is credited to the guild the
+export came from, as lifetime XP only: the current season's leaderboard is left alone.
+Each export is recorded in bot_meta by its SHA-256, and importing the same file into
+the same guild again is refused unless --force is given:
+
+    python backfill.py export.jsonl --guild-id 789
+
+A running bot keeps serving the rows it has cached until they are evicted or the bot
+restarts, so imported XP shows up sooner if the bot is stopped first.
+"""
+import argparse
+import bisect
+import csv
+import hashlib
+import io
+import json
+import time
+from array import array
+from datetime import datetime
+
+import bot
+
+PROGRESS_EVERY = 500000
+DIGEST_CHUNK = 1 << 20
+
+
+def parse_timestamp(value):
+    """Turn an export timestamp into epoch seconds"""
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e12 else float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def export_digest(path):
+    """SHA-256 of the export file, used to recognise an export that was already imported"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def already_imported(conn, key):
+    """When this export was imported into the guild, or None"""
+    c = conn.cursor()
+    c.execute('SELECT updated_at FROM bot_meta WHERE key = %s', (key,))
+    row = c.fetchone()
+    return row['updated_at'] if row else None
+
+
+def record_import(conn, key, rows, force=False):
+    """Claim the export in the merge's transaction, returning False if another run already did"""
+    c = conn.cursor()
+    conflict = 'DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()' if force else 'DO NOTHING'
+    c.execute(f'INSERT INTO bot_meta (key, value) VALUES (%s, %s) ON CONFLICT (key) {conflict}',
+              (key, json.dumps({'users': rows})))
+    return c.rowcount == 1
+
+
+def read_export(path):
+    """Stream the export into per-author timestamp arrays and the latest known name"""
+    timestamps = {}
+    names = {}
+    total = skipped = 0
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            total += 1
+            try:
+                record = json.loads(line)
+                if record.get('bot'):
+                    skipped += 1
+                    continue
+                author_id = int(record.get('author_id', record.get('author')))
+                ts = parse_timestamp(record['timestamp'])
+            except (ValueError, TypeError, KeyError):
+                skipped += 1
+                continue
+
+            if author_id not in timestamps:
+                timestamps[author_id] = array('d')
+            timestamps[author_id].append(ts)
+            if record.get('author_name'):
+                names[author_id] = record['author_name']
+
+            if total % PROGRESS_EVERY == 0:
+                print(f"📥 Read {total:,} messages...")
+
+    print(f"📥 Read {total:,} messages from {len(timestamps):,} authors ({skipped:,} skipped)")
+    return timestamps, names
+
+
+def replay_author(stamps, cooldown, xp_per_message):
+    """Apply the process_xp cooldown to one author's messages, returning (xp, awarded, last_award)
+
+    Each award depends on the previous one, so rather than stepping through every
+    message, each award bisects the sorted stamps to the first one past its cooldown.
+    """
+    ordered = sorted(stamps)
+    if not ordered:
+        return 0, 0, None
+    awarded = 0
+    index = 0
+    while index < len(ordered):
+        last_award = ordered[index]
+        awarded += 1
+        index = bisect.bisect_left(ordered, last_award + cooldown, index + 1)
+    return awarded * xp_per_message, awarded, last_award
+
+
+def load_guild_rules(conn, guild_id):
+    """Resolve the guild's effective XP rules, honouring its stored overrides"""
+    overrides = {}
+    c = conn.cursor()
+    c.execute('SELECT settings FROM guild_config WHERE guild_id = %s', (guild_id,))
+    row = c.fetchone()
+    if row:
+        overrides = row['settings']
+    return bot.build_guild_config(overrides)
+
+
+def build_copy_buffer(timestamps, names, cooldown, xp_per_message):
+    """Replay every author and render the results as CSV for COPY"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = 0
+    for author_id, stamps in timestamps.items():
+        xp, awarded, last_award = replay_author(stamps, cooldown, xp_per_message)
+        writer.writerow([author_id, names.get(author_id, str(author_id)), xp, awarded, repr(last_award)])
+        rows += 1
+    buffer.seek(0)
+    return buffer, rows
+
+
+def merge_backfill(conn, buffer, guild_id):
+    """COPY the replayed totals into a temp table and fold them into the guild's members in one statement
+
+    The XP is added to what members already have and is not credited to season_xp.
+    """
+    c = conn.cursor()
+    c.execute('''CREATE TEMP TABLE backfill_xp
+                 (user_id BIGINT PRIMARY KEY,
+                  username TEXT,
+                  xp INTEGER,
+                  total_messages INTEGER,
+                  last_message DOUBLE PRECISION) ON COMMIT DROP''')
+    c.copy_expert('COPY backfill_xp FROM STDIN WITH (FORMAT csv)', buffer)
+    c.execute('''
+        INSERT INTO guild_members (guild_id, user_id, username, xp, level, last_message, total_messages,
+                                   crystal_shards, blessings_given, blessings_received)
+        SELECT %(guild_id)s, user_id, username, xp, FLOOR(SQRT(xp / %(multiplier)s::float))::int + 1,
+               last_message, total_messages, 0, 0, 0
+        FROM backfill_xp
+        ON CONFLICT (guild_id, user_id) DO UPDATE SET
+            xp = guild_members.xp + EXCLUDED.xp,
+            level = FLOOR(SQRT((guild_members.xp + EXCLUDED.xp) / %(multiplier)s::float))::int + 1,
+            total_messages = guild_members.total_messages + EXCLUDED.total_messages,
+            last_message = GREATEST(guild_members.last_message, EXCLUDED.last_message),
+            username = COALESCE(guild_members.username, EXCLUDED.username)
+    ''', {'guild_id': guild_id, 'multiplier': bot.LEVEL_MULTIPLIER})
+    return c.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill Aetherius XP from a message export")
+    parser.add_argument('export', help="path to the JSON-lines message export")
+    parser.add_argument('--guild-id', type=int, required=True, help="guild the export came from")
+    parser.add_argument('--dry-run', action='store_true', help="replay and report without writing")
+    parser.add_argument('--force', action='store_true', help="import again even if this export was already imported")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    bot.init_db()
+    conn = None
+    try:
+        conn = bot.connect_db()
+        key = f'backfill:{args.guild_id}:{export_digest(args.export)}'
+        imported_at = already_imported(conn, key)
+        if imported_at and not args.force:
+            print(f"⚠️ This export was already imported into guild {args.guild_id} on {imported_at:%Y-%m-%d}, pass --force to add its XP again")
+            return
+
+        config = load_guild_rules(conn, args.guild_id)
+        print(f"⚙️ Replaying with {config['xp_per_message']} XP per message and a {config['xp_cooldown']}s cooldown")
+
+        timestamps, names = read_export(args.export)
+        buffer, rows = build_copy_buffer(timestamps, names, config['xp_cooldown'], config['xp_per_message'])
+
+        if args.dry_run:
+            print(f"🔍 Dry run: {rows:,} users would be updated")
+            return
+
+        if not record_import(conn, key, rows, args.force):
+            print(f"⚠️ Another run imported this export into guild {args.guild_id} meanwhile, nothing was written")
+            conn.rollback()
+            return
+        merged = merge_backfill(conn, buffer, args.guild_id)
+        conn.commit()
+        print(f"✅ Backfilled {merged:,} users in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"❌ Backfill failed: {e}")
+        if conn:
+            conn.rollback()
+        raise SystemExit(1)
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
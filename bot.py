@@ -1,17 +1,35 @@
 import discord
-from discord.ext import commands
+from discord import app_commands
+from discord.ext import commands, tasks
 import os
 import psycopg2
 from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, Json
 import asyncio
-from datetime import datetime, date
+import aiohttp
+import time
+from datetime import datetime, date, timedelta, timezone
 import random
+import json
+import hashlib
+import bisect
+import zlib
+import contextvars
+import functools
+import queue
+import urllib.request
+from contextlib import contextmanager
+import re
+import sys
+import traceback
+import tracemalloc
+import hmac
 from dotenv import load_dotenv
-from flask import Flask
+from flask import Flask, request, jsonify
 from threading import Thread
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 from threading import Lock
+import threading
 
 load_dotenv()
 
@@ -25,6 +43,21 @@ def home():
 def health():
     return {"status": "online", "bot": "Aetherius"}
 
+HEAP_PROFILE_TOKEN = os.getenv('HEAP_PROFILE_TOKEN', '')  # Enables /debug/heap/<action> on the health server
+
+@app.route('/debug/heap/<action>')
+def debug_heap(action):
+    # Header only: a query string token would end up in access logs
+    token = request.headers.get('X-Profile-Token', '')
+    if not HEAP_PROFILE_TOKEN:
+        return {"error": "heap profiling endpoint disabled"}, 404
+    if not hmac.compare_digest(token.encode(), HEAP_PROFILE_TOKEN.encode()):
+        return {"error": "forbidden"}, 403
+    if action not in HEAP_ACTIONS:
+        return {"error": f"unknown action, use one of {', '.join(HEAP_ACTIONS)}"}, 400
+    limit = request.args.get('limit', HEAP_REPORT_SIZE, type=int)
+    return jsonify(run_heap_action(action, request.args.get('group', 'lineno'), limit))
+
 def run_flask():
     port = int(os.environ.get("PORT", 10000))
     app.run(host='0.0.0.0', port=port)
@@ -34,43 +67,705 @@ def keep_alive():
     t.daemon = True
     t.start()
 
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', '')  # JSON-lines file path, or an http(s) Zipkin-compatible collector URL
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))  # Fraction of handler traces kept
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '1000'))  # Traces slower than this are kept regardless of sampling
+TRACING_ENABLED = bool(TRACE_EXPORT) and (TRACE_SAMPLE_RATE > 0 or TRACE_SLOW_MS > 0)
+TRACE_SERVICE_NAME = 'aetherius'
+
+trace_context = contextvars.ContextVar('trace_context', default=None)  # (trace, span id) of the innermost open span
+trace_queue = queue.Queue(maxsize=1000)
+trace_stats = {'exported': 0, 'dropped': 0, 'failed': 0}
+trace_exporter = None
+
+def open_span(name, tags, trace=None, parent_id=None):
+    return {'trace': trace, 'id': os.urandom(8).hex(), 'parent': parent_id, 'name': name,
+            'tags': tags, 'timestamp': time.time(), 'started': time.perf_counter()}
+
+def close_span(span, error=None):
+    span['duration'] = time.perf_counter() - span.pop('started')
+    if error is not None:
+        span['tags']['error'] = f"{type(error).__name__}: {error}"
+    span['trace']['spans'].append(span)
+
+@contextmanager
+def trace_span(name, **tags):
+    """Record a child span of the current trace; a no-op outside one"""
+    current = trace_context.get()
+    if current is None:
+        yield None
+        return
+    
+    trace, parent_id = current
+    span = open_span(name, tags, trace, parent_id)
+    token = trace_context.set((trace, span['id']))
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        trace_context.reset(token)
+        close_span(span, error)
+
+async def untraced(coro):
+    """Run a coroutine in a task of its own outside its creator's trace, which may be exported before it ends"""
+    trace_context.set(None)  # Tasks copy the context they were created in; this only clears the copy
+    return await coro
+
+def traced(func):
+    """Trace a coroutine: a child span inside a trace, otherwise the root of a new one"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if trace_context.get() is not None:
+            with trace_span(func.__name__):
+                return await func(*args, **kwargs)
+        if not TRACING_ENABLED:
+            return await func(*args, **kwargs)
+        
+        trace = {'id': os.urandom(16).hex(), 'spans': [], 'sampled': random.random() < TRACE_SAMPLE_RATE}
+        if not trace['sampled'] and not TRACE_SLOW_MS:
+            return await func(*args, **kwargs)
+        root = open_span(func.__name__, {}, trace)
+        token = trace_context.set((trace, root['id']))
+        error = None
+        try:
+            return await func(*args, **kwargs)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            trace_context.reset(token)
+            close_span(root, error)
+            if trace['sampled'] or (TRACE_SLOW_MS and root['duration'] * 1000 >= TRACE_SLOW_MS):
+                export_trace(trace)
+    return wrapper
+
+def export_trace(trace):
+    """Queue a finished trace as Zipkin v2 spans for the exporter thread"""
+    spans = [{
+        'traceId': trace['id'],
+        'id': span['id'],
+        'parentId': span['parent'],
+        'name': span['name'],
+        'timestamp': int(span['timestamp'] * 1_000_000),
+        'duration': max(1, int(span['duration'] * 1_000_000)),
+        'localEndpoint': {'serviceName': TRACE_SERVICE_NAME},
+        'tags': {key: str(value) for key, value in span['tags'].items()},
+    } for span in trace['spans']]
+    try:
+        trace_queue.put_nowait(spans)
+    except queue.Full:
+        trace_stats['dropped'] += 1
+
+def run_trace_exporter():
+    """Side thread that writes queued traces to TRACE_EXPORT in batches, off the event loop"""
+    while True:
+        batch = [trace_queue.get()]
+        while len(batch) < 100:
+            try:
+                batch.append(trace_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if TRACE_EXPORT.startswith(('http://', 'https://')):
+                body = json.dumps([span for spans in batch for span in spans]).encode()
+                export_request = urllib.request.Request(TRACE_EXPORT, data=body, headers={'Content-Type': 'application/json'})
+                urllib.request.urlopen(export_request, timeout=5).close()
+            else:
+                with open(TRACE_EXPORT, 'a', encoding='utf-8') as f:
+                    for spans in batch:
+                        f.write(json.dumps(spans) + '\n')
+            trace_stats['exported'] += len(batch)
+        except Exception as e:
+            trace_stats['failed'] += len(batch)
+            print(f"❌ Error exporting traces: {e}")
+
+async def on_http_request_start(session, context, params):
+    current = trace_context.get()
+    context.span = None
+    if current is not None:
+        trace, parent_id = current
+        context.span = open_span('discord.http', {'http.method': params.method, 'http.path': params.url.path}, trace, parent_id)
+
+async def on_http_request_end(session, context, params):
+    if context.span is not None:
+        context.span['tags']['http.status_code'] = params.response.status
+        close_span(context.span)
+
+async def on_http_request_exception(session, context, params):
+    if context.span is not None:
+        close_span(context.span, params.exception)
+
+def start_trace_exporter():
+    global trace_exporter
+    if TRACING_ENABLED and trace_exporter is None:
+        trace_exporter = Thread(target=run_trace_exporter, name="trace-exporter", daemon=True)
+        trace_exporter.start()
+        print(f"🔭 Exporting traces to {TRACE_EXPORT} ({TRACE_SAMPLE_RATE:.0%} sampled, plus any slower than {TRACE_SLOW_MS:.0f} ms)")
+
+def build_http_trace_config():
+    """aiohttp hooks that turn Discord REST and interaction calls into spans"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_http_request_start)
+    trace_config.on_request_end.append(on_http_request_end)
+    trace_config.on_request_exception.append(on_http_request_exception)
+    return trace_config
+
+# Memory-lean mode drops presences and caches only ourselves and members in voice. Everyone
+# else comes from event payloads or is fetched on demand, and guilds are not chunked at startup.
+MEMORY_LEAN = os.getenv('MEMORY_LEAN', 'false').lower() == 'true'
+MEMBER_CACHE_BYTES = 1600  # Heap cost of one cached member, measured with loadtest.py --members 20000
+MEMBER_FETCH_BATCH_SIZE = 1000  # Members paged over REST per role reconciliation batch in lean mode
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-intents.presences = True
+intents.presences = not MEMORY_LEAN
 intents.voice_states = True  # Added for voice chat tracking
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-connection_pool = None
+if MEMORY_LEAN:
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+else:
+    member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+
+bot = commands.Bot(command_prefix="!", intents=intents,
+                   member_cache_flags=member_cache_flags,
+                   chunk_guilds_at_startup=not MEMORY_LEAN,
+                   http_trace=build_http_trace_config() if TRACING_ENABLED else None)
+
+DB_POOL_MAX = 10
+DB_CHECKOUT_TIMEOUT = 5  # Seconds a handler waits for a free connection before giving up
+DB_STATEMENT_TIMEOUT = 5000  # Milliseconds before the server cancels a query
+DB_CONN_MAX_IDLE = 240  # Recycle connections idle longer than this (seconds)
+DB_CONN_MAX_AGE = 3600  # Recycle connections older than this (seconds)
+DB_CONN_PROBE_IDLE = 30  # Check connections idle longer than this with SELECT 1 before handing them out (seconds)
+
+REPLICA_MAX_LAG = 10  # Seconds of replication lag before reads fall back to the primary
+REPLICA_LAG_CHECK_INTERVAL = 5  # Seconds between replica lag measurements
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which pool it belongs to and how long it has lived"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_name = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.configured = False
+        self.prepared = set()
+    
+    def commit(self):
+        with trace_span('db.commit'):
+            super().commit()
+
+db_pools = {}  # 'primary' / 'replica' -> {'pool': ThreadedConnectionPool, 'slots': asyncio.Semaphore}
+
+replica_state = {'lag': 0.0, 'checked_at': 0.0, 'healthy': True}
+
+pool_stats = {
+    name: {'checkouts': 0, 'errors': 0, 'timeouts': 0, 'waited': 0, 'waiting': 0, 'recycled': 0,
+           'in_use': 0, 'peak_in_use': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+    for name in ('primary', 'replica')
+}
 
-def get_db_connection():
-    """Get a connection from the pool"""
-    global connection_pool
-    if connection_pool is None:
-        DATABASE_URL = os.getenv('DATABASE_URL')
+def get_database_url(name):
+    return os.getenv('DATABASE_URL' if name == 'primary' else 'DATABASE_REPLICA_URL')
+
+def connect_db(name='primary'):
+    """Open a standalone connection outside the pools, for migrations and offline jobs"""
+    DATABASE_URL = get_database_url(name)
+    if not DATABASE_URL:
+        raise Exception("❌ DATABASE_URL environment variable not set!")
+    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    conn.cursor().execute('SET statement_timeout = 0')
+    conn.commit()
+    return conn
+
+def get_pool(name):
+    """Create the named pool on first use"""
+    if name not in db_pools:
+        DATABASE_URL = get_database_url(name)
         if not DATABASE_URL:
             raise Exception("❌ DATABASE_URL environment variable not set!")
         
-        connection_pool = psycopg2.pool.ThreadedConnectionPool(
-            1, 10,
-            DATABASE_URL,
-            cursor_factory=RealDictCursor
-        )
-        print("✅ PostgreSQL connection pool created successfully!")
+        db_pools[name] = {
+            'pool': psycopg2.pool.ThreadedConnectionPool(
+                1, DB_POOL_MAX,
+                DATABASE_URL,
+                cursor_factory=RealDictCursor,
+                connection_factory=PooledConnection
+            ),
+            'slots': asyncio.Semaphore(DB_POOL_MAX)
+        }
+        print(f"✅ PostgreSQL {name} connection pool created successfully!")
+    return db_pools[name]
+
+def is_connection_stale(conn):
+    now = time.monotonic()
+    return (conn.closed
+            or now - conn.last_used > DB_CONN_MAX_IDLE
+            or now - conn.created_at > DB_CONN_MAX_AGE)
+
+def connection_answers(conn):
+    """Probe a connection idle long enough for the server or a proxy to have dropped it"""
+    if time.monotonic() - conn.last_used <= DB_CONN_PROBE_IDLE:
+        return True
+    try:
+        conn.cursor().execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+async def checkout_connection(name):
+    """Wait (bounded) for a pool slot and return a healthy connection"""
+    with trace_span('db.checkout', pool=name):
+        return await acquire_pool_connection(name)
+
+async def acquire_pool_connection(name):
+    db_pool = get_pool(name)
+    stats = pool_stats[name]
+    started = time.perf_counter()
+    
+    if db_pool['slots'].locked():
+        stats['waited'] += 1
+    stats['waiting'] += 1
+    try:
+        await asyncio.wait_for(db_pool['slots'].acquire(), DB_CHECKOUT_TIMEOUT)
+    except asyncio.TimeoutError:
+        stats['timeouts'] += 1
+        raise psycopg2.pool.PoolError(f"Timed out after {DB_CHECKOUT_TIMEOUT}s waiting for a {name} connection")
+    finally:
+        stats['waiting'] -= 1
     
-    return connection_pool.getconn()
+    conn = None
+    try:
+        conn = db_pool['pool'].getconn()
+        if is_connection_stale(conn) or not connection_answers(conn):
+            stats['recycled'] += 1
+            db_pool['pool'].putconn(conn, close=True)
+            conn = None
+            conn = db_pool['pool'].getconn()
+        if not conn.configured:
+            conn.pool_name = name
+            conn.cursor().execute('SET statement_timeout = %s', (DB_STATEMENT_TIMEOUT,))
+            conn.commit()
+            conn.configured = True
+    except Exception:
+        stats['errors'] += 1
+        # Close a connection that failed setup so it does not leave the pool one short
+        if conn is not None:
+            db_pool['pool'].putconn(conn, close=True)
+        db_pool['slots'].release()
+        raise
+    
+    wait = time.perf_counter() - started
+    stats['checkouts'] += 1
+    stats['wait_total'] += wait
+    stats['wait_max'] = max(stats['wait_max'], wait)
+    stats['in_use'] += 1
+    stats['peak_in_use'] = max(stats['peak_in_use'], stats['in_use'])
+    return conn
+
+async def get_db_connection(read_only=False):
+    """Get a connection from the pool, routing read-only work to the replica when it is healthy"""
+    if read_only:
+        conn = await get_replica_connection()
+        if conn:
+            return conn
+    
+    return await checkout_connection('primary')
+
+async def get_replica_connection():
+    """Get a replica connection, or None when no replica is configured or it is lagging"""
+    if not get_database_url('replica'):
+        return None
+    
+    now = datetime.now().timestamp()
+    recheck = now - replica_state['checked_at'] >= REPLICA_LAG_CHECK_INTERVAL
+    if not recheck and (not replica_state['healthy'] or replica_state['lag'] > REPLICA_MAX_LAG):
+        return None
+    
+    conn = None
+    try:
+        conn = await checkout_connection('replica')
+        
+        if recheck:
+            replica_state['checked_at'] = now
+            c = conn.cursor()
+            execute_query(c, 'replica_lag')
+            replica_state['lag'] = float(c.fetchone()['lag'])
+            replica_state['healthy'] = True
+            conn.rollback()
+            if replica_state['lag'] > REPLICA_MAX_LAG:
+                print(f"⚠️ Replica lag {replica_state['lag']:.1f}s, routing reads to primary")
+                release_db_connection(conn)
+                return None
+        
+        return conn
+    except Exception as e:
+        print(f"❌ Replica unavailable, routing reads to primary: {e}")
+        replica_state['healthy'] = False
+        replica_state['checked_at'] = now
+        if conn:
+            release_db_connection(conn)
+        return None
 
 def release_db_connection(conn):
-    """Release connection back to the pool"""
-    global connection_pool
-    if connection_pool:
-        connection_pool.putconn(conn)
+    """Release connection back to the pool it came from, recycling it if it is broken"""
+    name = conn.pool_name or 'primary'
+    db_pool = db_pools.get(name)
+    if not db_pool:
+        return
+    
+    status = conn.get_transaction_status() if not conn.closed else None
+    broken = conn.closed or status in (psycopg2.extensions.TRANSACTION_STATUS_INERROR,
+                                       psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN)
+    if not broken and status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+    if broken:
+        pool_stats[name]['recycled'] += 1
+    else:
+        conn.last_used = time.monotonic()
+    
+    pool_stats[name]['in_use'] -= 1
+    db_pool['pool'].putconn(conn, close=broken)
+    db_pool['slots'].release()
+
+def close_db_pools():
+    """Close every connection in every pool"""
+    for name, db_pool in db_pools.items():
+        db_pool['pool'].closeall()
+    db_pools.clear()
+
+# Opt-in: behind a transaction-mode PgBouncer (such as Neon's pooled URLs) the next EXECUTE can
+# land on a server connection that never saw the PREPARE
+DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', 'false').lower() == 'true'
+
+GUILD_MEMBER_PARTITIONS = 16  # Hash partitions of guild_members; fixed once the table has been created
+LEGACY_XP_GUILD_ID = int(os.getenv('LEGACY_XP_GUILD_ID', '0'))  # Guild that inherits the global users table
+LEGACY_XP_BATCH_SIZE = 1000  # Legacy users copied per migration transaction
+LEGACY_XP_BATCH_DELAY = 0.5  # Seconds between migration batches so live writes are not starved
+
+# Every statement the bot runs outside schema setup, by name. Pooled connections
+# PREPARE each one the first time it is used and EXECUTE it by name afterwards.
+QUERIES = {
+    # Guild members: XP, levels and stats per (guild_id, user_id), hash-partitioned by guild.
+    # Every query names its guild so only that guild's partition is touched.
+    'member_row': '''SELECT * FROM guild_members WHERE guild_id = %s AND user_id = %s''',
+    'member_xp_state': '''SELECT xp, level, last_message, total_messages FROM guild_members WHERE guild_id = %s AND user_id = %s''',
+    'member_xp_level': '''SELECT xp, level FROM guild_members WHERE guild_id = %s AND user_id = %s''',
+    'member_crystal_state': '''SELECT xp, level, crystal_shards FROM guild_members WHERE guild_id = %s AND user_id = %s''',
+    'member_levels': '''SELECT user_id, level FROM guild_members WHERE guild_id = %s AND user_id = ANY(%s)''',
+    # A member's first row in the guild that inherited the global users table starts from their legacy totals.
+    # Rows created before that guild is known stay unseeded, and the legacy migration adds the totals later.
+    'insert_member': '''INSERT INTO guild_members
+        (guild_id, user_id, username, xp, level, last_message, total_messages,
+         crystal_shards, blessings_given, blessings_received, seeded)
+        SELECT v.guild_id, v.user_id, v.username, v.xp + COALESCE(u.xp, 0),
+               FLOOR(SQRT((v.xp + COALESCE(u.xp, 0)) / v.multiplier))::int + 1,
+               GREATEST(v.last_message, u.last_message), v.total_messages + COALESCE(u.total_messages, 0),
+               v.crystal_shards + COALESCE(u.crystal_shards, 0), v.blessings_given + COALESCE(u.blessings_given, 0),
+               v.blessings_received + COALESCE(u.blessings_received, 0), (v.guild_id = m.guild_id) IS TRUE
+        FROM (VALUES (%s::bigint, %s::bigint, %s::text, %s::int, %s::double precision, %s::int,
+                      %s::int, %s::int, %s::int, %s::float))
+             AS v (guild_id, user_id, username, xp, last_message, total_messages,
+                   crystal_shards, blessings_given, blessings_received, multiplier)
+        LEFT JOIN (SELECT (value::jsonb ->> 'guild_id')::bigint AS guild_id
+                   FROM bot_meta WHERE key = 'guild_xp_migration') m ON TRUE
+        LEFT JOIN users u ON u.user_id = v.user_id AND v.guild_id = m.guild_id
+        RETURNING *''',
+    # Member writes return the full row so the user cache can be refreshed without a re-read.
+    # They add to the stored totals and derive the level from the new XP, so a backfill, the legacy
+    # migration or another instance writing the same row is never overwritten with cached values.
+    'update_member_xp': '''UPDATE guild_members
+        SET xp = xp + %s, level = FLOOR(SQRT((xp + %s) / %s::float))::int + 1
+        WHERE guild_id = %s AND user_id = %s
+        RETURNING *''',
+    'update_member_message_xp': '''UPDATE guild_members
+        SET xp = xp + %s, level = FLOOR(SQRT((xp + %s) / %s::float))::int + 1,
+            last_message = %s, total_messages = total_messages + 1, username = %s
+        WHERE guild_id = %s AND user_id = %s
+        RETURNING *''',
+    'update_member_crystals': '''UPDATE guild_members
+        SET xp = xp + %s, level = FLOOR(SQRT((xp + %s) / %s::float))::int + 1, crystal_shards = crystal_shards + 1
+        WHERE guild_id = %s AND user_id = %s
+        RETURNING *''',
+    'update_member_blessings_given': '''UPDATE guild_members
+        SET xp = xp + %s, level = FLOOR(SQRT((xp + %s) / %s::float))::int + 1, blessings_given = blessings_given + 1
+        WHERE guild_id = %s AND user_id = %s
+        RETURNING *''',
+    'update_member_blessings_received': '''UPDATE guild_members
+        SET xp = xp + %s, level = FLOOR(SQRT((xp + %s) / %s::float))::int + 1, blessings_received = blessings_received + 1
+        WHERE guild_id = %s AND user_id = %s
+        RETURNING *''',
+    'member_profile': '''SELECT m.*, q.quest_id, q.quest_slot, q.quest_name, q.quest_type, q.quest_description,
+               q.quest_reward, q.progress, q.target, q.completed, q.claimed, q.assigned_date, q.expires_date,
+               q.seen, q.completed_date
+        FROM guild_members m
+        LEFT JOIN user_quests q ON q.guild_id = m.guild_id AND q.user_id = m.user_id AND q.expires_date >= %s
+        WHERE m.guild_id = %s AND m.user_id = %s
+        ORDER BY q.expires_date, q.quest_id''',
+    # Leaderboard pages seek on (xp, user_id) within the guild through idx_guild_members_xp,
+    # so deep pages cost the same as the first
+    'leaderboard_first': '''SELECT user_id, username, xp, level
+        FROM guild_members
+        WHERE guild_id = %s
+        ORDER BY xp DESC, user_id DESC
+        LIMIT %s''',
+    'leaderboard_after': '''SELECT user_id, username, xp, level
+        FROM guild_members
+        WHERE guild_id = %s AND (xp, user_id) < (%s, %s)
+        ORDER BY xp DESC, user_id DESC
+        LIMIT %s''',
+    'leaderboard_from': '''SELECT user_id, username, xp, level
+        FROM guild_members
+        WHERE guild_id = %s AND (xp, user_id) <= (%s, %s)
+        ORDER BY xp DESC, user_id DESC
+        LIMIT %s''',
+    'leaderboard_before': '''SELECT * FROM (
+            SELECT user_id, username, xp, level
+            FROM guild_members
+            WHERE guild_id = %s AND (xp, user_id) > (%s, %s)
+            ORDER BY xp ASC, user_id ASC
+            LIMIT %s
+        ) page
+        ORDER BY xp DESC, user_id DESC''',
+    # Counting the members ahead walks (xp, user_id) up to the member's rank, so it stops at a cap
+    'leaderboard_position': '''WITH me AS (
+            SELECT guild_id, xp, user_id FROM guild_members WHERE guild_id = %s AND user_id = %s
+        )
+        SELECT me.xp, me.user_id,
+               (SELECT COUNT(*) FROM (
+                    SELECT 1 FROM guild_members a
+                    WHERE a.guild_id = me.guild_id AND (a.xp, a.user_id) > (me.xp, me.user_id)
+                    LIMIT %s
+                ) capped) AS ahead
+        FROM me''',
+    
+    # Seasons: XP earned during the newest season is added to season_xp, partitioned by season
+    'season_info': '''SELECT * FROM seasons WHERE season = %s''',
+    'add_season_xp': '''INSERT INTO season_xp (season, guild_id, user_id, xp)
+        SELECT MAX(season), %s, %s, %s FROM seasons
+        ON CONFLICT (season, guild_id, user_id) DO UPDATE SET xp = season_xp.xp + EXCLUDED.xp''',
+    'end_season': '''UPDATE seasons SET ended_at = NOW()
+        WHERE season = (SELECT MAX(season) FROM seasons)
+          AND ended_at IS NULL AND started_at <= NOW() - %s * INTERVAL '1 day'
+        RETURNING season''',
+    'start_season': '''INSERT INTO seasons (season) VALUES (%s)''',
+    'season_leaderboard_first': '''SELECT s.user_id, m.username, s.xp, m.level
+        FROM season_xp s JOIN guild_members m ON m.guild_id = s.guild_id AND m.user_id = s.user_id
+        WHERE s.season = %s AND s.guild_id = %s
+        ORDER BY s.xp DESC, s.user_id DESC
+        LIMIT %s''',
+    'season_leaderboard_after': '''SELECT s.user_id, m.username, s.xp, m.level
+        FROM season_xp s JOIN guild_members m ON m.guild_id = s.guild_id AND m.user_id = s.user_id
+        WHERE s.season = %s AND s.guild_id = %s AND (s.xp, s.user_id) < (%s, %s)
+        ORDER BY s.xp DESC, s.user_id DESC
+        LIMIT %s''',
+    'season_leaderboard_from': '''SELECT s.user_id, m.username, s.xp, m.level
+        FROM season_xp s JOIN guild_members m ON m.guild_id = s.guild_id AND m.user_id = s.user_id
+        WHERE s.season = %s AND s.guild_id = %s AND (s.xp, s.user_id) <= (%s, %s)
+        ORDER BY s.xp DESC, s.user_id DESC
+        LIMIT %s''',
+    'season_leaderboard_before': '''SELECT * FROM (
+            SELECT s.user_id, m.username, s.xp, m.level
+            FROM season_xp s JOIN guild_members m ON m.guild_id = s.guild_id AND m.user_id = s.user_id
+            WHERE s.season = %s AND s.guild_id = %s AND (s.xp, s.user_id) > (%s, %s)
+            ORDER BY s.xp ASC, s.user_id ASC
+            LIMIT %s
+        ) page
+        ORDER BY xp DESC, user_id DESC''',
+    'season_leaderboard_position': '''WITH me AS (
+            SELECT season, guild_id, xp, user_id FROM season_xp WHERE season = %s AND guild_id = %s AND user_id = %s
+        )
+        SELECT me.xp, me.user_id,
+               (SELECT COUNT(*) FROM (
+                    SELECT 1 FROM season_xp a
+                    WHERE a.season = me.season AND a.guild_id = me.guild_id
+                      AND (a.xp, a.user_id) > (me.xp, me.user_id)
+                    LIMIT %s
+                ) capped) AS ahead
+        FROM me''',
+    
+    # Activity rollups: messages per guild, channel and hour. channel_id 0 holds the guild's total for the hour,
+    # so the heatmap reads one row per hour however many channels are active
+    'add_activity': '''INSERT INTO activity_rollup (guild_id, channel_id, hour, messages)
+        SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::timestamptz[], %s::int[])
+        ON CONFLICT (guild_id, channel_id, hour) DO UPDATE
+        SET messages = activity_rollup.messages + EXCLUDED.messages''',
+    'activity_hours': '''SELECT hour, messages FROM activity_rollup
+        WHERE guild_id = %s AND channel_id = 0 AND hour >= %s
+        ORDER BY hour''',
+    # Channel totals are also kept per day, so top channels reads one row per channel per day
+    'add_channel_activity': '''INSERT INTO activity_daily (guild_id, day, channel_id, messages)
+        SELECT * FROM unnest(%s::bigint[], %s::date[], %s::bigint[], %s::int[])
+        ON CONFLICT (guild_id, day, channel_id) DO UPDATE
+        SET messages = activity_daily.messages + EXCLUDED.messages''',
+    'activity_top_channels': '''SELECT channel_id, SUM(messages)::bigint AS messages FROM activity_daily
+        WHERE guild_id = %s AND day >= %s
+        GROUP BY channel_id
+        ORDER BY messages DESC, channel_id
+        LIMIT %s''',
+    'prune_activity': '''DELETE FROM activity_rollup WHERE hour < %s''',
+    'prune_channel_activity': '''DELETE FROM activity_daily WHERE day < %s''',
+    
+    # One-time copy of the global users table into the guild that inherits it, in keyset batches
+    # Members who chatted before the guild was known have unseeded rows; their legacy totals are added once
+    'migrate_legacy_users': '''WITH batch AS (
+            SELECT * FROM users WHERE user_id > %s ORDER BY user_id LIMIT %s
+        ), moved AS (
+            INSERT INTO guild_members
+                (guild_id, user_id, username, xp, level, last_message, total_messages,
+                 crystal_shards, blessings_given, blessings_received, seeded)
+            SELECT %s, user_id, username, COALESCE(xp, 0), COALESCE(level, 1), last_message,
+                   COALESCE(total_messages, 0), COALESCE(crystal_shards, 0),
+                   COALESCE(blessings_given, 0), COALESCE(blessings_received, 0), TRUE
+            FROM batch
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                xp = guild_members.xp + EXCLUDED.xp,
+                level = FLOOR(SQRT((guild_members.xp + EXCLUDED.xp) / %s::float))::int + 1,
+                last_message = GREATEST(guild_members.last_message, EXCLUDED.last_message),
+                total_messages = guild_members.total_messages + EXCLUDED.total_messages,
+                crystal_shards = guild_members.crystal_shards + EXCLUDED.crystal_shards,
+                blessings_given = guild_members.blessings_given + EXCLUDED.blessings_given,
+                blessings_received = guild_members.blessings_received + EXCLUDED.blessings_received,
+                seeded = TRUE
+            WHERE NOT guild_members.seeded
+            RETURNING user_id
+        )
+        SELECT COUNT(*) AS scanned, MAX(user_id) AS last_user_id, (SELECT COUNT(*) FROM moved) AS moved,
+               (SELECT COALESCE(array_agg(user_id), '{}') FROM moved) AS moved_ids
+        FROM batch''',
+    # Season XP from before the upgrade sits under guild 0; members may already have rows in the guild since
+    'merge_legacy_season_xp': '''INSERT INTO season_xp (season, guild_id, user_id, xp)
+        SELECT season, %s, user_id, xp FROM season_xp WHERE guild_id = 0
+        ON CONFLICT (season, guild_id, user_id) DO UPDATE SET xp = season_xp.xp + EXCLUDED.xp''',
+    'delete_legacy_season_xp': '''DELETE FROM season_xp WHERE guild_id = 0''',
+    'legacy_users_exist': '''SELECT EXISTS (SELECT 1 FROM users) AS found''',
+    
+    # Quests
+    # Quests: each guild hands out and rewards its own, so every statement is scoped by (guild_id, user_id)
+    'active_quests': '''SELECT * FROM user_quests
+        WHERE guild_id = %s AND user_id = %s AND expires_date >= %s
+        ORDER BY expires_date, quest_id''',
+    'assign_quest': '''INSERT INTO user_quests
+        (guild_id, user_id, quest_slot, quest_name, quest_type, quest_description,
+         quest_reward, target, assigned_date, expires_date)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (guild_id, user_id, quest_slot, assigned_date) DO NOTHING''',
+    'claim_quests': '''UPDATE user_quests
+        SET claimed = TRUE, completed_date = %s
+        WHERE guild_id = %s AND user_id = %s AND expires_date >= %s AND completed AND NOT claimed
+        RETURNING *''',
+    # Quests from before per-guild quests wait under guild 0 until the legacy guild is known, like season XP
+    'adopt_legacy_quests': '''UPDATE user_quests q SET guild_id = %s
+        WHERE q.guild_id = 0 AND NOT EXISTS (
+            SELECT 1 FROM user_quests o
+            WHERE o.guild_id = %s AND o.user_id = q.user_id
+              AND o.quest_slot = q.quest_slot AND o.assigned_date = q.assigned_date)
+        RETURNING q.user_id''',
+    'delete_legacy_quests': '''DELETE FROM user_quests WHERE guild_id = 0''',
+    # advance_quests_<event> statements are generated from the quest handler registry
+    
+    # Guild configuration
+    'guild_configs_all': '''SELECT guild_id, settings, version FROM guild_config''',
+    'guild_config_versions': '''SELECT guild_id, version FROM guild_config''',
+    'guild_configs_by_id': '''SELECT guild_id, settings, version FROM guild_config WHERE guild_id = ANY(%s)''',
+    'upsert_guild_config': '''INSERT INTO guild_config (guild_id, settings)
+        VALUES (%s, %s)
+        ON CONFLICT (guild_id) DO UPDATE
+        SET settings = guild_config.settings || EXCLUDED.settings,
+            version = guild_config.version + 1,
+            updated_at = NOW()
+        RETURNING settings, version''',
+    'reset_guild_setting': '''UPDATE guild_config
+        SET settings = settings - %s::text,
+            version = version + 1,
+            updated_at = NOW()
+        WHERE guild_id = %s
+        RETURNING settings, version''',
+    
+    # Bot metadata
+    'bot_meta_get': '''SELECT value FROM bot_meta WHERE key = %s''',
+    'bot_meta_set': '''INSERT INTO bot_meta (key, value)
+        VALUES (%s, %s)
+        ON CONFLICT (key) DO UPDATE
+        SET value = EXCLUDED.value, updated_at = NOW()''',
+    'snapshot_get': '''SELECT data FROM runtime_snapshot WHERE name = %s''',
+    'snapshot_set': '''INSERT INTO runtime_snapshot (name, data)
+        VALUES (%s, %s)
+        ON CONFLICT (name) DO UPDATE
+        SET data = EXCLUDED.data, saved_at = NOW()''',
+    'members_by_key': '''SELECT m.* FROM guild_members m
+        JOIN unnest(%s::bigint[], %s::bigint[]) AS k (guild_id, user_id)
+          ON m.guild_id = k.guild_id AND m.user_id = k.user_id''',
+    
+    # Health and replication
+    'ping': '''SELECT 1''',
+    'replica_lag': '''SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END AS lag''',
+    # Planner estimates and relation sizes come from the catalogs, so this stays cheap as tables grow
+    # Partitions are folded into their parent table
+    'table_stats': '''SELECT COALESCE(p.relname, s.relname) AS relname,
+               SUM(CASE WHEN cl.reltuples < 0 THEN s.n_live_tup ELSE cl.reltuples END)::BIGINT AS estimated_rows,
+               SUM(s.n_live_tup)::BIGINT AS n_live_tup, SUM(s.n_dead_tup)::BIGINT AS n_dead_tup,
+               SUM(pg_table_size(s.relid))::BIGINT AS table_size,
+               SUM(pg_indexes_size(s.relid))::BIGINT AS index_size,
+               MAX(GREATEST(s.last_autovacuum, s.last_vacuum)) AS last_vacuum
+        FROM pg_stat_user_tables s
+        JOIN pg_class cl ON cl.oid = s.relid
+        LEFT JOIN pg_inherits i ON i.inhrelid = s.relid
+        LEFT JOIN pg_class p ON p.oid = i.inhparent
+        WHERE COALESCE(p.relname, s.relname) = ANY(%s)
+        GROUP BY 1
+        ORDER BY 1''',
+}
+
+def to_positional(sql):
+    """Rewrite psycopg2 %s placeholders as the $1, $2, ... form PREPARE expects"""
+    count = 0
+    def number(match):
+        nonlocal count
+        count += 1
+        return f"${count}"
+    return re.sub(r'%s', number, sql), count
+
+PREPARED_QUERIES = {name: to_positional(sql) for name, sql in QUERIES.items()}
+
+def execute_query(c, name, params=()):
+    """Run a registered statement, preparing it once per pooled connection"""
+    with trace_span('db.query', query=name):
+        conn = c.connection
+        if not DB_PREPARED_STATEMENTS or not isinstance(conn, PooledConnection):
+            c.execute(QUERIES[name], params or None)
+            return c
+        
+        sql, param_count = PREPARED_QUERIES[name]
+        if name not in conn.prepared:
+            c.execute(f"PREPARE {name} AS {sql}")
+            conn.prepared.add(name)
+        if param_count:
+            c.execute(f"EXECUTE {name} ({', '.join(['%s'] * param_count)})", params)
+        else:
+            c.execute(f"EXECUTE {name}")
+        return c
+
+def create_season_partition(c, season):
+    c.execute(f'CREATE TABLE IF NOT EXISTS season_xp_{int(season)} PARTITION OF season_xp FOR VALUES IN ({int(season)})')
 
 def init_db():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = connect_db()
         c = conn.cursor()
         
         c.execute('''CREATE TABLE IF NOT EXISTS users
@@ -103,9 +798,33 @@ def init_db():
             c.execute('ALTER TABLE users ADD COLUMN blessings_received INTEGER DEFAULT 0')
             print("✅ Added blessings_received column to existing database")
         
+        # users no longer serves leaderboards, so its old XP index only slows the legacy table down
+        c.execute('DROP INDEX IF EXISTS idx_users_xp')
+        
+        # users is the pre-guild global table, kept only as the source of the legacy XP migration
+        c.execute('''CREATE TABLE IF NOT EXISTS guild_members
+                     (guild_id BIGINT NOT NULL,
+                      user_id BIGINT NOT NULL,
+                      username TEXT,
+                      xp INTEGER NOT NULL DEFAULT 0,
+                      level INTEGER NOT NULL DEFAULT 1,
+                      last_message DOUBLE PRECISION,
+                      total_messages INTEGER NOT NULL DEFAULT 0,
+                      crystal_shards INTEGER NOT NULL DEFAULT 0,
+                      blessings_given INTEGER NOT NULL DEFAULT 0,
+                      blessings_received INTEGER NOT NULL DEFAULT 0,
+                      seeded BOOLEAN NOT NULL DEFAULT FALSE,
+                      PRIMARY KEY (guild_id, user_id)) PARTITION BY HASH (guild_id)''')
+        for remainder in range(GUILD_MEMBER_PARTITIONS):
+            c.execute(f'''CREATE TABLE IF NOT EXISTS guild_members_p{remainder} PARTITION OF guild_members
+                          FOR VALUES WITH (MODULUS {GUILD_MEMBER_PARTITIONS}, REMAINDER {remainder})''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_guild_members_xp ON guild_members (guild_id, xp, user_id)')
+        
         c.execute('''CREATE TABLE IF NOT EXISTS user_quests
                      (quest_id SERIAL PRIMARY KEY,
+                      guild_id BIGINT NOT NULL,
                       user_id BIGINT NOT NULL,
+                      quest_slot TEXT NOT NULL DEFAULT 'daily',
                       quest_name TEXT NOT NULL,
                       quest_type TEXT NOT NULL,
                       quest_description TEXT,
@@ -115,8 +834,10 @@ def init_db():
                       completed BOOLEAN DEFAULT FALSE,
                       claimed BOOLEAN DEFAULT FALSE,
                       assigned_date DATE NOT NULL,
+                      expires_date DATE,
+                      seen TEXT[] DEFAULT '{}',
                       completed_date TIMESTAMP,
-                      UNIQUE(user_id, assigned_date))''')
+                      UNIQUE(guild_id, user_id, quest_slot, assigned_date))''')
         
         c.execute('''CREATE TABLE IF NOT EXISTS quest_progress
                      (id SERIAL PRIMARY KEY,
@@ -131,11 +852,126 @@ def init_db():
                       late_night_active BOOLEAN DEFAULT FALSE,
                       UNIQUE(user_id, quest_date))''')
         
+        c.execute("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name = 'user_quests'
+        """)
+        quest_columns = [row['column_name'] for row in c.fetchall()]
+        
+        if 'quest_slot' not in quest_columns:
+            # One quest per slot (daily, weekly, event) per period instead of one per day
+            c.execute("ALTER TABLE user_quests ADD COLUMN quest_slot TEXT NOT NULL DEFAULT 'daily'")
+            c.execute('ALTER TABLE user_quests ADD COLUMN expires_date DATE')
+            c.execute("ALTER TABLE user_quests ADD COLUMN seen TEXT[] DEFAULT '{}'")
+            c.execute('UPDATE user_quests SET expires_date = assigned_date')
+            c.execute('''UPDATE user_quests q
+                         SET seen = CASE q.quest_type WHEN 'messages' THEN p.unique_channels ELSE p.commands_used END
+                         FROM quest_progress p
+                         WHERE p.user_id = q.user_id AND p.quest_date = q.assigned_date
+                           AND q.quest_type IN ('messages', 'commands')''')
+            c.execute('ALTER TABLE user_quests DROP CONSTRAINT IF EXISTS user_quests_user_id_assigned_date_key')
+            c.execute('ALTER TABLE user_quests ADD CONSTRAINT user_quests_user_id_quest_slot_assigned_date_key '
+                      'UNIQUE (user_id, quest_slot, assigned_date)')
+            print("✅ Migrated user_quests to quest slots")
+        
         c.execute('''CREATE TABLE IF NOT EXISTS prophecies
                      (date TEXT PRIMARY KEY,
                       prophecy TEXT,
                       omen_type TEXT)''')
         
+        c.execute('''CREATE TABLE IF NOT EXISTS guild_config
+                     (guild_id BIGINT PRIMARY KEY,
+                      settings JSONB NOT NULL DEFAULT '{}',
+                      version INTEGER NOT NULL DEFAULT 1,
+                      updated_at TIMESTAMP DEFAULT NOW())''')
+        
+        c.execute('''CREATE TABLE IF NOT EXISTS bot_meta
+                     (key TEXT PRIMARY KEY,
+                      value TEXT,
+                      updated_at TIMESTAMP DEFAULT NOW())''')
+        
+        if LEGACY_XP_GUILD_ID:
+            c.execute('''INSERT INTO bot_meta (key, value) VALUES ('guild_xp_migration', %s)
+                         ON CONFLICT (key) DO NOTHING''',
+                      (json.dumps({'guild_id': LEGACY_XP_GUILD_ID, 'last_user_id': 0, 'done': False}),))
+        
+        c.execute("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name = 'guild_members'
+        """)
+        if 'seeded' not in [row['column_name'] for row in c.fetchall()]:
+            # Rows in the legacy guild were seeded on insert or copied by the migration; others never were
+            c.execute('ALTER TABLE guild_members ADD COLUMN seeded BOOLEAN NOT NULL DEFAULT FALSE')
+            c.execute('''UPDATE guild_members SET seeded = TRUE
+                         WHERE guild_id = (SELECT (value::jsonb ->> 'guild_id')::bigint
+                                           FROM bot_meta WHERE key = 'guild_xp_migration')''')
+            print("✅ Added seeded column to guild_members")
+        
+        if 'guild_id' not in quest_columns:
+            # Quests were global; they move to the legacy guild, or wait under guild 0 for migrate_legacy_xp
+            c.execute('ALTER TABLE user_quests ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0')
+            c.execute('ALTER TABLE user_quests ALTER COLUMN guild_id DROP DEFAULT')
+            c.execute('''UPDATE user_quests
+                         SET guild_id = COALESCE((SELECT (value::jsonb ->> 'guild_id')::bigint
+                                                  FROM bot_meta WHERE key = 'guild_xp_migration'), 0)''')
+            c.execute('ALTER TABLE user_quests DROP CONSTRAINT IF EXISTS user_quests_user_id_quest_slot_assigned_date_key')
+            c.execute('ALTER TABLE user_quests ADD CONSTRAINT user_quests_guild_id_user_id_quest_slot_assigned_date_key '
+                      'UNIQUE (guild_id, user_id, quest_slot, assigned_date)')
+            print("✅ Added guild_id column to user_quests")
+        
+        c.execute('''CREATE TABLE IF NOT EXISTS seasons
+                     (season INTEGER PRIMARY KEY,
+                      started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                      ended_at TIMESTAMP)''')
+        
+        c.execute('''CREATE TABLE IF NOT EXISTS season_xp
+                     (season INTEGER NOT NULL,
+                      guild_id BIGINT NOT NULL,
+                      user_id BIGINT NOT NULL,
+                      xp INTEGER NOT NULL DEFAULT 0,
+                      PRIMARY KEY (season, guild_id, user_id)) PARTITION BY LIST (season)''')
+        
+        c.execute("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name = 'season_xp'
+        """)
+        if 'guild_id' not in [row['column_name'] for row in c.fetchall()]:
+            # Season XP from before per-guild storage is parked under guild 0 until the legacy migration adopts it
+            c.execute('ALTER TABLE season_xp ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0')
+            c.execute('ALTER TABLE season_xp ALTER COLUMN guild_id DROP DEFAULT')
+            c.execute('ALTER TABLE season_xp DROP CONSTRAINT season_xp_pkey')
+            c.execute('ALTER TABLE season_xp ADD PRIMARY KEY (season, guild_id, user_id)')
+            c.execute('DROP INDEX IF EXISTS idx_season_xp_rank')
+            print("✅ Added guild_id to season_xp")
+        c.execute('CREATE INDEX IF NOT EXISTS idx_season_xp_guild_rank ON season_xp (season, guild_id, xp, user_id)')
+        c.execute('INSERT INTO seasons (season) VALUES (1) ON CONFLICT DO NOTHING')
+        c.execute('SELECT MAX(season) AS season FROM seasons')
+        current = c.fetchone()['season']
+        create_season_partition(c, current)
+        create_season_partition(c, current + 1)
+        
+        c.execute('''CREATE TABLE IF NOT EXISTS activity_rollup
+                     (guild_id BIGINT NOT NULL,
+                      channel_id BIGINT NOT NULL,
+                      hour TIMESTAMPTZ NOT NULL,
+                      messages INTEGER NOT NULL DEFAULT 0,
+                      PRIMARY KEY (guild_id, channel_id, hour))''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_activity_rollup_hour ON activity_rollup (guild_id, hour)')
+        c.execute('''CREATE TABLE IF NOT EXISTS activity_daily
+                     (guild_id BIGINT NOT NULL,
+                      day DATE NOT NULL,
+                      channel_id BIGINT NOT NULL,
+                      messages INTEGER NOT NULL DEFAULT 0,
+                      PRIMARY KEY (guild_id, day, channel_id))''')
+        
+        c.execute('''CREATE TABLE IF NOT EXISTS runtime_snapshot
+                     (name TEXT PRIMARY KEY,
+                      data BYTEA NOT NULL,
+                      saved_at TIMESTAMP DEFAULT NOW())''')
+        
         conn.commit()
         print("✅ Database tables initialized successfully!")
         print("✅ Quest system tables created!")
@@ -145,25 +981,168 @@ def init_db():
             conn.rollback()
     finally:
         if conn:
-            release_db_connection(conn)
+            conn.close()
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '5000'))
+QUEST_COLUMNS = ('quest_id', 'quest_slot', 'quest_name', 'quest_type', 'quest_description', 'quest_reward',
+                 'progress', 'target', 'completed', 'claimed', 'assigned_date', 'expires_date', 'seen',
+                 'completed_date')
+
+# user_id -> {'members': {guild_id: guild_members row}, 'quests': {guild_id: active quests}, 'quest_date': date},
+# least recently used first. Each 'quests' list is the complete list of the user's active quests in that guild
+# as of quest_date.
+# Entries only ever come from the primary, and every write path refreshes them from its RETURNING row.
+user_cache = OrderedDict()
+user_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def get_user_cache_entry(user_id):
+    """Return a user's cache entry, dropping quests cached on a previous day"""
+    entry = user_cache.get(user_id)
+    if entry is None:
+        return None
+    user_cache.move_to_end(user_id)
+    if 'quest_date' in entry and entry['quest_date'] != date.today():
+        del entry['quests'], entry['quest_date']
+    return entry
+
+def get_cached_member(guild_id, user_id):
+    """Return the cached guild_members row, or None on a miss"""
+    entry = get_user_cache_entry(user_id)
+    if entry and guild_id in entry.get('members', ()):
+        user_cache_stats['hits'] += 1
+        return entry['members'][guild_id]
+    user_cache_stats['misses'] += 1
+    return None
+
+def store_user_cache_entry(user_id, **fields):
+    entry = user_cache.setdefault(user_id, {})
+    entry.update(fields)
+    user_cache.move_to_end(user_id)
+    while len(user_cache) > USER_CACHE_SIZE:
+        user_cache.popitem(last=False)
+        user_cache_stats['evictions'] += 1
+
+def cache_member_row(row):
+    """Remember a guild_members row read from or written to the primary"""
+    members = user_cache.get(row['user_id'], {}).get('members', {})
+    members[row['guild_id']] = dict(row)
+    store_user_cache_entry(row['user_id'], members=members)
+
+def get_cached_quests(guild_id, user_id):
+    """Return the user's cached active quests in the guild, or None on a miss"""
+    entry = get_user_cache_entry(user_id)
+    if entry and guild_id in entry.get('quests', ()):
+        return entry['quests'][guild_id]
+    return None
+
+def cache_user_quests(guild_id, user_id, quests, today):
+    """Remember the user's full list of active quests in the guild as read from the primary"""
+    entry = user_cache.get(user_id, {})
+    cached = entry.get('quests', {}) if entry.get('quest_date') == today else {}
+    cached[guild_id] = [dict(quest) for quest in quests]
+    store_user_cache_entry(user_id, quests=cached, quest_date=today)
+
+def merge_cached_quests(guild_id, user_id, rows):
+    """Fold quest rows returned by a write into the cached list, if there is one"""
+    entry = user_cache.get(user_id)
+    if not entry or guild_id not in entry.get('quests', ()):
+        return
+    updated = {row['quest_id']: dict(row) for row in rows}
+    entry['quests'][guild_id] = [updated.get(quest['quest_id'], quest) for quest in entry['quests'][guild_id]]
 
+def invalidate_cached_user(user_id):
+    user_cache.pop(user_id, None)
 
 XP_PER_MESSAGE = 15
 XP_COOLDOWN = 60
 LEVEL_MULTIPLIER = 100
 
+SEASON_LENGTH_DAYS = int(os.getenv('SEASON_LENGTH_DAYS', '30'))  # 0 disables automatic season rollover
+SEASON_CHECK_INTERVAL = 3600  # Seconds between checks for a season that has run its length
+
+ACTIVITY_FLUSH_INTERVAL = 60  # Seconds between writes of buffered message counts
+ACTIVITY_RETENTION_DAYS = 90  # Hourly rollups older than this are pruned
+STATS_DAYS = 7  # Days covered by /stats: at most STATS_DAYS * 24 hourly totals and STATS_DAYS rows per channel are read
+STATS_TOP_CHANNELS = 5
+
+# (guild_id, channel_id, hour start in epoch seconds) -> messages not yet written to activity_rollup
+activity_buffer = defaultdict(int)
+activity_state = {'pruned_hour': None}
+
 message_counter = defaultdict(int)
 crystals = {}
 crystal_lock = Lock()
 xp_cooldowns = {}
+background_tasks = set()  # Fire-and-forget tasks, referenced until done so they are not garbage collected
+
+def run_in_background(coro):
+    """Start a task the caller does not await, keeping it alive and reporting any exception it raises"""
+    task = asyncio.create_task(untraced(coro), name=coro.__qualname__)
+    background_tasks.add(task)
+    task.add_done_callback(finish_background_task)
+    return task
+
+def finish_background_task(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"❌ Background task {task.get_name()} failed: {task.exception()}")
 
 CRYSTAL_DROP_CHANCE = 50
+CRYSTAL_LIFETIME = 30  # Seconds a crystal shard stays claimable
 
 keyword_cooldowns = defaultdict(float)
 KEYWORD_COOLDOWN = 30
 
 voice_tracking = {}  # user_id -> {join_time: timestamp}
 
+LOOP_LAG_INTERVAL = 0.5  # Seconds between event-loop lag samples
+loop_lag_samples = deque(maxlen=120)  # Most recent loop lag measurements in seconds
+loop_lag_task = None
+legacy_migration_task = None  # Copies the global users table into per-guild rows after the first on_ready
+
+BLOCKING_THRESHOLD = 0.1  # Seconds the loop may take to answer a watchdog ping before it counts as blocked
+BLOCKING_SAMPLE_INTERVAL = 0.02  # Seconds between watchdog checks and stack samples
+blocking_state = {'loop': None, 'loop_thread': None, 'watchdog': None, 'pong': 0.0,
+                  'stalls': 0, 'sampled_since': time.time()}
+blocking_sites = {}  # (call site, leaf frame) -> {'samples': int, 'stalls': int, 'last_seen': timestamp}
+blocking_lock = Lock()
+
+HEAP_ACTIONS = ('start', 'snapshot', 'diff', 'sizes', 'stop')
+HEAP_TRACE_FRAMES = 10  # Frames kept per allocation; only the innermost one is used for grouping
+HEAP_REPORT_SIZE = 10  # Allocation sites shown per report
+HEAP_SIZE_DEPTH = 3  # Container levels followed when estimating the size of bot state
+HEAP_GAUGED_STATE = ('user_cache', 'xp_cooldowns', 'message_counter', 'crystals', 'keyword_cooldowns',
+                     'voice_tracking', 'bless_cooldowns', 'deferred_quest_progress', 'blocking_sites',
+                     'recent_joins', 'pending_welcomes', 'welcome_channels', 'role_index', 'guild_configs',
+                     'pending_crystals', 'loop_lag_samples', 'activity_buffer',
+                     'background_tasks')
+heap_state = {'baseline': None, 'started': None}
+heap_lock = Lock()  # Shared by the health server thread and slash commands
+
+# on_message degrades in stages under overload: 1 skips keyword replies and crystal drops,
+# 2 also defers quest progress, 3 also samples XP. Slash commands are never shed.
+LOAD_SHED_LAG_THRESHOLDS = (0.1, 0.25, 0.5)  # Loop lag in seconds that enters stages 1, 2 and 3
+LOAD_SHED_POOL_THRESHOLDS = (0.7, 0.9, 1.2)  # Primary pool demand (in use + waiting) / DB_POOL_MAX for each stage
+LOAD_SHED_RECOVERY_SAMPLES = 10  # Consecutive calmer lag samples before stepping down one stage
+XP_SAMPLE_RATE = 0.25  # Fraction of messages still run through process_xp in stage 3
+load_shed_state = {'stage': 0, 'calm_samples': 0, 'flushing': False}
+load_shed_stats = defaultdict(int)
+deferred_quest_progress = defaultdict(set)  # (guild_id, user_id) -> {('message', channel_id, day), ('help', None, day), ...}
+
+startup_timings = {}  # phase name -> seconds, reported once on the first on_ready
+startup_mark = time.perf_counter()
+
+WELCOME_CHANNEL_NAMES = ['welcome', 'general', 'gatehouse', 'entrance', 'lobby']
+WELCOME_BURST_WINDOW = 60  # Seconds of join history used to detect a join flood
+WELCOME_BURST_THRESHOLD = 5  # Joins within the window before switching to digests
+WELCOME_DIGEST_INTERVAL = 30  # Seconds between digest embeds during a flood
+WELCOME_DIGEST_MENTIONS = 20  # Members mentioned by name in a single digest
+
+welcome_channels = {}  # guild_id -> resolved welcome channel (None if the guild has none)
+recent_joins = defaultdict(deque)  # guild_id -> join timestamps inside the burst window
+pending_welcomes = defaultdict(list)  # guild_id -> members waiting for the next digest
+welcome_digest_tasks = {}  # guild_id -> running digest task
+
 ROLE_REWARDS = {
     0: "Cloud-Walker",
     5: "Mist-Warden",
@@ -175,6 +1154,13 @@ ROLE_REWARDS = {
     60: "Arcadian Paragon"
 }
 
+ROLE_SYNC_INTERVAL = 3600  # Seconds between full role reconciliation passes
+ROLE_SYNC_BATCH_SIZE = 10  # Members updated per batch
+ROLE_SYNC_BATCH_DELAY = 5  # Seconds to pause between batches
+
+role_index = {}  # guild_id -> {role_name: role}
+hierarchy_warnings = set()  # (guild_id, role_id) of reward roles already reported as above the bot's top role
+
 LEVEL_BLESSINGS = {
     1: "✨",
     5: "⚔️",
@@ -229,9 +1215,570 @@ QUEST_TYPES = {
         "reward": 400,
         "target": 1,
         "type": "late_night"
+    },
+    "pilgrim_of_the_isles": {
+        "name": "Pilgrim of the Isles",
+        "description": "Send messages in 10 different channels this week",
+        "reward": 1000,
+        "target": 10,
+        "type": "messages",
+        "slot": "weekly"
+    },
+    "voice_council": {
+        "name": "Voice Council",
+        "description": "Spend 3 hours in voice chat this week",
+        "reward": 1500,
+        "target": 10800,  # 3 hours in seconds
+        "type": "voice",
+        "slot": "weekly"
     }
 }
 
+# Days a recurring quest slot lasts. Quests default to "daily"; "event" quests carry their own
+# "starts"/"ends" dates and are handed to everyone while the event runs.
+QUEST_SLOT_DAYS = {"daily": 1, "weekly": 7}
+QUEST_PERIOD_EPOCH = date(2024, 1, 1)  # A Monday, so weekly quests run Monday to Sunday
+
+# Quest type -> {'events', 'progress', 'distinct'}, filled by register_quest_type, and
+# event -> (generated statement name, value placeholders, subscribed quest types)
+QUEST_HANDLERS = {}
+QUEST_EVENT_QUERIES = {}
+
+def sql_list(names):
+    return ', '.join(f"'{name}'" for name in sorted(names))
+
+def build_quest_event_queries():
+    """Compile one UPDATE per event that advances every subscribed quest type at once"""
+    QUEST_EVENT_QUERIES.clear()
+    events = {event for handler in QUEST_HANDLERS.values() for event in handler['events']}
+    for event in sorted(events):
+        types = {quest_type: handler for quest_type, handler in sorted(QUEST_HANDLERS.items())
+                 if event in handler['events']}
+        distinct = [quest_type for quest_type, handler in types.items() if handler['distinct']]
+        progress = ' '.join(f"WHEN '{quest_type}' THEN {handler['progress']}" for quest_type, handler in types.items())
+        
+        sets = [f"progress = CASE quest_type {progress} END",
+                f"completed = (CASE quest_type {progress} END) >= target"]
+        where = []
+        if distinct:
+            sets.insert(0, f"seen = CASE WHEN quest_type IN ({sql_list(distinct)}) "
+                           f"THEN array_append(seen, {{value}}::text) ELSE seen END")
+            where.append(f"NOT (quest_type IN ({sql_list(distinct)}) AND {{value}}::text = ANY(seen))")
+        where += ["guild_id = %s", "user_id = %s", "assigned_date <= %s", "expires_date >= %s", "NOT completed",
+                  f"quest_type IN ({sql_list(types)})"]
+        
+        sql = (f"UPDATE user_quests\n        SET {', '.join(sets)}\n"
+               f"        WHERE {' AND '.join(where)}\n        RETURNING *").replace('{value}', '%s')
+        name = f"advance_quests_{event}"
+        QUERIES[name] = sql
+        PREPARED_QUERIES[name] = to_positional(sql)
+        QUEST_EVENT_QUERIES[event] = (name, sql.count('%s') - 4, frozenset(types))
+
+def register_quest_type(quest_type, *events, progress="progress + 1", distinct=False):
+    """Declare the events a quest type listens to and the SQL for its new progress.
+    
+    {value} in the expression stands for the event's value. Distinct types count each
+    value once, remembering the ones already seen on the quest row.
+    """
+    QUEST_HANDLERS[quest_type] = {'events': events, 'progress': progress, 'distinct': distinct}
+    build_quest_event_queries()
+
+register_quest_type('messages', 'message', distinct=True)  # Distinct channels posted in
+register_quest_type('commands', 'command', distinct=True)  # Distinct bot commands used
+register_quest_type('reactions', 'reaction')
+register_quest_type('voice', 'voice', progress="progress + {value}::int")  # Seconds spent in voice
+register_quest_type('help', 'help', progress="target")
+register_quest_type('late_night', 'late_night', progress="target")
+
+# Badges earned when a member counter reaches a threshold. Counters only ever grow,
+# so a badge is held exactly when its counter is at or past the threshold.
+ACHIEVEMENTS = {
+    "chatterbox": {"name": "Chatterbox", "emoji": "💬", "counter": "total_messages", "threshold": 100},
+    "wordsmith": {"name": "Wordsmith", "emoji": "📜", "counter": "total_messages", "threshold": 1000},
+    "living_legend": {"name": "Living Legend", "emoji": "🏛️", "counter": "total_messages", "threshold": 10000},
+    "shard_seeker": {"name": "Shard Seeker", "emoji": "💠", "counter": "crystal_shards", "threshold": 10},
+    "crystal_hoarder": {"name": "Crystal Hoarder", "emoji": "💎", "counter": "crystal_shards", "threshold": 50},
+    "kind_soul": {"name": "Kind Soul", "emoji": "🤲", "counter": "blessings_given", "threshold": 10},
+    "beacon_of_grace": {"name": "Beacon of Grace", "emoji": "🕊️", "counter": "blessings_given", "threshold": 100},
+    "beloved": {"name": "Beloved", "emoji": "💖", "counter": "blessings_received", "threshold": 10},
+    "chosen_of_arcadia": {"name": "Chosen of Arcadia", "emoji": "🌠", "counter": "blessings_received", "threshold": 100},
+}
+
+ACHIEVEMENT_COUNTERS = {
+    "total_messages": "messages",
+    "crystal_shards": "crystal shards",
+    "blessings_given": "blessings given",
+    "blessings_received": "blessings received",
+}
+
+ACHIEVEMENT_LADDERS = {}  # counter -> (ascending thresholds, achievement keys in the same order)
+
+def build_achievement_ladders():
+    """Sort each counter's thresholds once so an event only looks up the next one"""
+    ACHIEVEMENT_LADDERS.clear()
+    rungs = defaultdict(list)
+    for key, achievement in ACHIEVEMENTS.items():
+        rungs[achievement['counter']].append((achievement['threshold'], key))
+    for counter, entries in rungs.items():
+        entries.sort()
+        ACHIEVEMENT_LADDERS[counter] = (tuple(t for t, _ in entries), tuple(k for _, k in entries))
+
+build_achievement_ladders()
+
+def reached_achievements(counter, before, after):
+    """Keys of the achievements a counter crossed moving from before to after"""
+    ladder = ACHIEVEMENT_LADDERS.get(counter)
+    if not ladder:
+        return []
+    thresholds, keys = ladder
+    start = bisect.bisect_right(thresholds, before or 0)
+    # The common case: the counter is still short of its next threshold
+    if start == len(thresholds) or thresholds[start] > (after or 0):
+        return []
+    return list(keys[start:bisect.bisect_right(thresholds, after, start)])
+
+def unlocked_achievements(row):
+    """Every achievement a member row's counters have reached, in ladder order"""
+    unlocked = []
+    for counter, (thresholds, keys) in ACHIEVEMENT_LADDERS.items():
+        unlocked.extend(keys[:bisect.bisect_right(thresholds, row.get(counter) or 0)])
+    return unlocked
+
+def next_achievement(row):
+    """The locked achievement closest to completion as (key, current value), or None"""
+    best = None
+    for counter, (thresholds, keys) in ACHIEVEMENT_LADDERS.items():
+        value = row.get(counter) or 0
+        index = bisect.bisect_right(thresholds, value)
+        if index < len(thresholds):
+            progress = value / thresholds[index]
+            if best is None or progress > best[0]:
+                best = (progress, keys[index], value)
+    return best and best[1:]
+
+async def announce_achievements(channel, member, keys):
+    """Post an embed for newly unlocked achievements"""
+    if not keys or not channel:
+        return
+    lines = []
+    for key in keys:
+        achievement = ACHIEVEMENTS[key]
+        lines.append(f"{achievement['emoji']} **{achievement['name']}** • "
+                     f"{achievement['threshold']:,} {ACHIEVEMENT_COUNTERS[achievement['counter']]}")
+    embed = discord.Embed(
+        title="🏅 ACHIEVEMENT UNLOCKED!",
+        description=f"{member.mention} has earned:\n\n" + "\n".join(lines),
+        color=0xDAA520
+    )
+    try:
+        await channel.send(embed=embed)
+    except discord.HTTPException as e:
+        print(f"⚠️ Could not announce achievements for {member}: {e}")
+
+GUILD_CONFIG_REFRESH_INTERVAL = 60  # Seconds between checks for config changes made elsewhere
+
+# Settings admins can override per guild, with the type each value must parse to
+GUILD_SETTINGS = {
+    "xp_per_message": int,
+    "xp_cooldown": int,
+    "crystal_drop_chance": int,
+    "keyword_cooldown": int,
+    "bless_cooldown": int,
+    "role_rewards": dict,
+    "quest_types": dict,
+}
+
+guild_configs = {}  # guild_id -> {'version': int, 'overrides': dict, 'config': dict}
+default_guild_config = None
+
+def build_guild_config(overrides):
+    """Merge a guild's stored overrides on top of the module defaults"""
+    role_rewards = dict(ROLE_REWARDS)
+    if 'role_rewards' in overrides:
+        role_rewards = {int(level): name for level, name in overrides['role_rewards'].items()}
+    
+    quest_types = {key: dict(quest) for key, quest in QUEST_TYPES.items()}
+    for key, quest in overrides.get('quest_types', {}).items():
+        if quest is None:
+            quest_types.pop(key, None)
+        else:
+            quest_types[key] = {**quest_types.get(key, {}), **quest}
+    
+    return {
+        "xp_per_message": overrides.get('xp_per_message', XP_PER_MESSAGE),
+        "xp_cooldown": overrides.get('xp_cooldown', XP_COOLDOWN),
+        "crystal_drop_chance": overrides.get('crystal_drop_chance', CRYSTAL_DROP_CHANCE),
+        "keyword_cooldown": overrides.get('keyword_cooldown', KEYWORD_COOLDOWN),
+        "bless_cooldown": overrides.get('bless_cooldown', BLESS_COOLDOWN),
+        "role_rewards": role_rewards,
+        "role_milestones": sorted(role_rewards),
+        "quest_types": quest_types,
+    }
+
+def get_guild_config(guild_id):
+    """Return the effective config for a guild from the in-memory cache, never touching the DB"""
+    global default_guild_config
+    entry = guild_configs.get(guild_id)
+    if entry:
+        return entry['config']
+    if default_guild_config is None:
+        default_guild_config = build_guild_config({})
+    return default_guild_config
+
+def cache_guild_config(guild_id, settings, version):
+    """Store a guild's overrides and derived config in the cache"""
+    guild_configs[guild_id] = {
+        'version': version,
+        'overrides': settings,
+        'config': build_guild_config(settings)
+    }
+
+async def load_guild_configs():
+    """Load every guild config row into the cache"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'guild_configs_all')
+        for row in c.fetchall():
+            cache_guild_config(row['guild_id'], row['settings'], row['version'])
+        print(f"✅ Loaded config for {len(guild_configs)} guilds")
+    except Exception as e:
+        print(f"❌ Error loading guild configs: {e}")
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+def parse_guild_setting(setting, value):
+    """Parse and validate an admin-supplied value for a guild setting"""
+    expected = GUILD_SETTINGS[setting]
+    if expected is int:
+        parsed = int(value)
+        if parsed < (1 if setting == 'crystal_drop_chance' else 0):
+            raise ValueError(f"{setting} must be a positive number")
+        return parsed
+    
+    parsed = json.loads(value)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"{setting} must be a JSON object")
+    
+    if setting == 'role_rewards':
+        return {str(int(level)): str(name) for level, name in parsed.items()}
+    
+    for key, quest in parsed.items():
+        if quest is not None and not isinstance(quest, dict):
+            raise ValueError(f"Quest '{key}' must be a JSON object, or null to disable it")
+    merged = build_guild_config({'quest_types': parsed})['quest_types']
+    if not merged:
+        raise ValueError("At least one quest type must stay enabled")
+    for key, quest in merged.items():
+        missing = {'name', 'description', 'reward', 'target', 'type'} - set(quest)
+        if missing:
+            raise ValueError(f"Quest '{key}' is missing: {', '.join(sorted(missing))}")
+        # Checked here because a bad value would otherwise only fail later, at every quest assignment
+        for field in ('name', 'description'):
+            if not isinstance(quest[field], str):
+                raise ValueError(f"Quest '{key}' {field} must be text")
+        for field in ('reward', 'target'):
+            if not isinstance(quest[field], int) or isinstance(quest[field], bool) or quest[field] < 1:
+                raise ValueError(f"Quest '{key}' {field} must be a positive whole number")
+        if quest['type'] not in QUEST_HANDLERS:
+            raise ValueError(f"Quest '{key}' has unknown type '{quest['type']}'")
+        slot = quest.get('slot', 'daily')
+        if slot == 'event':
+            starts, ends = quest.get('starts'), quest.get('ends')
+            if not isinstance(starts, str) or not isinstance(ends, str):
+                raise ValueError(f"Event quest '{key}' needs \"starts\" and \"ends\" dates as YYYY-MM-DD")
+            if date.fromisoformat(starts) > date.fromisoformat(ends):
+                raise ValueError(f"Event quest '{key}' ends before it starts")
+        elif slot not in QUEST_SLOT_DAYS:
+            raise ValueError(f"Quest '{key}' has unknown slot '{slot}'")
+    return parsed
+
+@tasks.loop(seconds=GUILD_CONFIG_REFRESH_INTERVAL)
+async def refresh_guild_configs():
+    """Pick up config rows changed outside this process"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'guild_config_versions')
+        versions = {row['guild_id']: row['version'] for row in c.fetchall()}
+        for guild_id in set(guild_configs) - set(versions):
+            del guild_configs[guild_id]
+        stale = [guild_id for guild_id, version in versions.items()
+                 if guild_configs.get(guild_id, {}).get('version') != version]
+        if stale:
+            execute_query(c, 'guild_configs_by_id', (stale,))
+            for row in c.fetchall():
+                cache_guild_config(row['guild_id'], row['settings'], row['version'])
+            print(f"🔄 Reloaded config for {len(stale)} guilds")
+    except Exception as e:
+        print(f"❌ Error refreshing guild configs: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+async def monitor_loop_lag():
+    """Continuously measure how late the event loop wakes up from a fixed sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag_samples.append(max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
+        update_load_shed_stage()
+
+def describe_frame(frame):
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+
+def sample_blocked_stack():
+    """Attribute one sample of a stalled loop to its innermost bot.py frame and the call it is stuck in"""
+    frame = sys._current_frames().get(blocking_state['loop_thread'])
+    if frame is None:
+        return None
+    stack = traceback.extract_stack(frame)
+    own_frames = [f for f in stack if f.filename == __file__]
+    call_site = describe_frame(own_frames[-1]) if own_frames else "outside bot.py"
+    return call_site, describe_frame(stack[-1])
+
+def answer_watchdog_ping():
+    blocking_state['pong'] = time.monotonic()
+
+def watch_event_loop():
+    """Side thread that pings the loop and samples its stack while a ping goes unanswered"""
+    loop = blocking_state['loop']
+    stalled_sites = None
+    ping = None
+    while not loop.is_closed():
+        time.sleep(BLOCKING_SAMPLE_INTERVAL)
+        if ping is None or blocking_state['pong'] >= ping:
+            stalled_sites = None
+            ping = time.monotonic()
+            loop.call_soon_threadsafe(answer_watchdog_ping)
+            continue
+        if time.monotonic() - ping < BLOCKING_THRESHOLD:
+            continue
+        
+        site = sample_blocked_stack()
+        if site is None:
+            continue
+        with blocking_lock:
+            if stalled_sites is None:
+                stalled_sites = set()
+                blocking_state['stalls'] += 1
+            entry = blocking_sites.setdefault(site, {'samples': 0, 'stalls': 0, 'last_seen': 0})
+            entry['samples'] += 1
+            entry['last_seen'] = time.time()
+            if site not in stalled_sites:
+                stalled_sites.add(site)
+                entry['stalls'] += 1
+
+def start_blocking_watchdog():
+    """Start the watchdog thread for the running loop; call from inside the loop"""
+    if blocking_state['watchdog'] is None:
+        blocking_state['loop'] = asyncio.get_running_loop()
+        blocking_state['loop_thread'] = threading.get_ident()
+        blocking_state['watchdog'] = Thread(target=watch_event_loop, name="loop-watchdog", daemon=True)
+        blocking_state['watchdog'].start()
+
+def estimate_size(obj, depth=HEAP_SIZE_DEPTH):
+    """Shallow size of obj plus its contents, following containers depth levels down"""
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+    # Copy before walking: the health server thread sizes state the loop is mutating
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, depth - 1) + estimate_size(v, depth - 1) for k, v in list(obj.items()))
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(estimate_size(item, depth - 1) for item in list(obj))
+    return size
+
+def state_size_gauges():
+    """Entry count and estimated bytes of the bot's module-level state, plus discord.py's caches"""
+    gauges = {}
+    for name in HEAP_GAUGED_STATE:
+        value = globals().get(name)
+        if value is not None:
+            gauges[name] = {'entries': len(value), 'bytes': estimate_size(value)}
+    gauges['discord_users'] = {'entries': len(bot.users)}
+    gauges['discord_members'] = {'entries': sum(len(guild.members) for guild in bot.guilds)}
+    gauges['discord_messages'] = {'entries': len(bot.cached_messages)}
+    return gauges
+
+def take_heap_snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+def describe_heap_stat(stat, group):
+    frame = stat.traceback[0]
+    site = frame.filename if group == 'filename' else f"{frame.filename}:{frame.lineno}"
+    entry = {'site': site, 'size': stat.size, 'count': stat.count}
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        entry['size_diff'] = stat.size_diff
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+def run_heap_action(action, group='lineno', limit=HEAP_REPORT_SIZE):
+    """Run one of HEAP_ACTIONS and return a JSON-friendly report; diff compares against the last snapshot"""
+    group = group if group in ('lineno', 'filename') else 'lineno'
+    with heap_lock:
+        report = {'action': action}
+        if action == 'start':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(HEAP_TRACE_FRAMES)
+                heap_state['started'] = time.time()
+            heap_state['baseline'] = None
+        elif action == 'stop':
+            tracemalloc.stop()
+            heap_state['baseline'] = None
+            heap_state['started'] = None
+        elif action == 'sizes':
+            report['gauges'] = state_size_gauges()
+        elif not tracemalloc.is_tracing():
+            report['error'] = "tracemalloc is not running, start it first"
+        elif action == 'snapshot':
+            snapshot = take_heap_snapshot()
+            heap_state['baseline'] = snapshot
+            report['stats'] = [describe_heap_stat(stat, group) for stat in snapshot.statistics(group)[:limit]]
+        elif heap_state['baseline'] is None:
+            report['error'] = "no baseline yet, take a snapshot first"
+        else:
+            diff = take_heap_snapshot().compare_to(heap_state['baseline'], group)
+            report['stats'] = [describe_heap_stat(stat, group) for stat in diff[:limit]]
+        
+        report['tracing'] = tracemalloc.is_tracing()
+        if report['tracing']:
+            report['traced'], report['traced_peak'] = tracemalloc.get_traced_memory()
+            report['started'] = heap_state['started']
+        return report
+
+def get_pressure_stage():
+    """Stage the current loop lag and primary pool demand call for"""
+    lag = loop_lag_samples[-1] if loop_lag_samples else 0.0
+    stats = pool_stats['primary']
+    demand = (stats['in_use'] + stats['waiting']) / DB_POOL_MAX
+    stage = 0
+    for level, (lag_limit, pool_limit) in enumerate(zip(LOAD_SHED_LAG_THRESHOLDS, LOAD_SHED_POOL_THRESHOLDS), 1):
+        if lag >= lag_limit or demand >= pool_limit:
+            stage = level
+    return stage, lag, demand
+
+def update_load_shed_stage():
+    """Step up as soon as pressure rises, step down one stage at a time once it has stayed lower"""
+    target, lag, demand = get_pressure_stage()
+    stage = load_shed_state['stage']
+    
+    if target > stage:
+        load_shed_state['calm_samples'] = 0
+    elif target < stage:
+        load_shed_state['calm_samples'] += 1
+        if load_shed_state['calm_samples'] < LOAD_SHED_RECOVERY_SAMPLES:
+            return
+        load_shed_state['calm_samples'] = 0
+        target = stage - 1
+    else:
+        load_shed_state['calm_samples'] = 0
+        return
+    
+    load_shed_state['stage'] = target
+    load_shed_stats['stage_changes'] += 1
+    if target:
+        print(f"⚠️ Load shedding stage {target} (loop lag {lag * 1000:.0f} ms, pool demand {demand:.0%})")
+    else:
+        print("✅ Load shedding off")
+    
+    if target < 2 and deferred_quest_progress and not load_shed_state['flushing']:
+        run_in_background(flush_deferred_quest_progress())
+
+def should_shed(stage, counter):
+    """True when the current stage sheds this step, counting each shed decision"""
+    if load_shed_state['stage'] >= stage:
+        load_shed_stats[counter] += 1
+        return True
+    return False
+
+async def record_quest_progress(guild_id, user_id, progress_type, channel_id=None, defer=False):
+    """Update quest progress now, or queue it for flush_deferred_quest_progress while shedding"""
+    if defer:
+        # Keep the day so a flush after midnight credits the quests that were active when it happened
+        deferred_quest_progress[(guild_id, user_id)].add((progress_type, channel_id, date.today()))
+        return
+    await update_quest_progress(guild_id, user_id, progress_type, channel_id=channel_id)
+
+async def flush_deferred_quest_progress(force=False):
+    """Replay quest progress deferred during overload; unique channels and flags coalesce without loss"""
+    load_shed_state['flushing'] = True
+    try:
+        while deferred_quest_progress and (force or load_shed_state['stage'] < 2):
+            (guild_id, user_id), events = deferred_quest_progress.popitem()
+            for progress_type, channel_id, day in events:
+                await update_quest_progress(guild_id, user_id, progress_type, channel_id=channel_id, day=day)
+                load_shed_stats['quest_replayed'] += 1
+    finally:
+        load_shed_state['flushing'] = False
+
+def record_activity(guild_id, channel_id):
+    """Count a message towards the current hour; flush_activity writes the counts out"""
+    activity_buffer[(guild_id, channel_id, int(time.time()) // 3600 * 3600)] += 1
+
+async def flush_activity():
+    """Add the buffered counts, each guild's hourly totals and daily channel totals to the rollups in one transaction"""
+    global activity_buffer
+    if not activity_buffer:
+        return 0
+    pending, activity_buffer = activity_buffer, defaultdict(int)
+    rows = defaultdict(int)
+    days = defaultdict(int)
+    for (guild_id, channel_id, hour), count in pending.items():
+        rows[(guild_id, channel_id, hour)] += count
+        rows[(guild_id, 0, hour)] += count
+        days[(guild_id, datetime.fromtimestamp(hour, timezone.utc).date(), channel_id)] += count
+    # A fixed order so concurrent flushes lock rows in the same sequence
+    keys = sorted(rows)
+    day_keys = sorted(days)
+    
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'add_activity', ([guild_id for guild_id, _, _ in keys],
+                                          [channel_id for _, channel_id, _ in keys],
+                                          [datetime.fromtimestamp(hour, timezone.utc) for _, _, hour in keys],
+                                          [rows[key] for key in keys]))
+        execute_query(c, 'add_channel_activity', ([guild_id for guild_id, _, _ in day_keys],
+                                                  [day for _, day, _ in day_keys],
+                                                  [channel_id for _, _, channel_id in day_keys],
+                                                  [days[key] for key in day_keys]))
+        current_hour = int(time.time()) // 3600
+        if activity_state['pruned_hour'] != current_hour:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=ACTIVITY_RETENTION_DAYS)
+            execute_query(c, 'prune_activity', (cutoff,))
+            execute_query(c, 'prune_channel_activity', (cutoff.date(),))
+        conn.commit()
+        activity_state['pruned_hour'] = current_hour
+        return len(keys)
+    except Exception as e:
+        print(f"❌ Error flushing activity rollups: {e}")
+        if conn:
+            conn.rollback()
+        # Put the counts back so the next flush retries them
+        for key, count in pending.items():
+            activity_buffer[key] += count
+        return 0
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+def add_season_xp(c, guild_id, user_id, amount):
+    """Credit XP to the running season as part of the caller's guild_members write"""
+    if amount:
+        execute_query(c, 'add_season_xp', (guild_id, user_id, amount))
+
 def calculate_xp_for_level(level):
     return LEVEL_MULTIPLIER * (level - 1) ** 2
 
@@ -241,51 +1788,340 @@ def get_user_level(xp):
         level += 1
     return level
 
-async def get_or_assign_daily_quest(user_id):
-    """Get today's quest for user, or assign a new one if none exists"""
+def build_role_index(guild):
+    """Rebuild the role-name index for a guild"""
+    roles = {}
+    for role in guild.roles:
+        roles.setdefault(role.name, role)
+    role_index[guild.id] = roles
+    return roles
+
+def get_role_by_name(guild, role_name):
+    """Look up a guild role by name using the cached index"""
+    roles = role_index.get(guild.id)
+    if roles is None:
+        roles = build_role_index(guild)
+    return roles.get(role_name)
+
+def get_missing_reward_roles(member, level):
+    """Return the reward roles a member has earned at this level but does not hold yet"""
+    config = get_guild_config(member.guild.id)
+    bot_member = member.guild.me
+    missing = []
+    for milestone in config['role_milestones']:
+        if level < milestone:
+            break
+        role_name = config['role_rewards'][milestone]
+        role = get_role_by_name(member.guild, role_name)
+        if not role or member.get_role(role.id):
+            continue
+        warning_key = (member.guild.id, role.id)
+        if role >= bot_member.top_role:
+            # Reconciliation checks every member each pass; report the role once, not once per member
+            if warning_key not in hierarchy_warnings:
+                hierarchy_warnings.add(warning_key)
+                print(f"⚠️ Cannot assign role {role_name} in {member.guild.name} - role hierarchy issue")
+            continue
+        hierarchy_warnings.discard(warning_key)
+        missing.append(role)
+    return missing
+
+def get_unearned_reward_roles(member, level):
+    """Return the reward roles a member holds above their level, e.g. after an admin lowered their XP"""
+    config = get_guild_config(member.guild.id)
+    bot_member = member.guild.me
+    unearned = []
+    for milestone in config['role_milestones']:
+        if level >= milestone:
+            continue
+        role = get_role_by_name(member.guild, config['role_rewards'][milestone])
+        if role and member.get_role(role.id) and role < bot_member.top_role:
+            unearned.append(role)
+    return unearned
+
+@traced
+async def grant_reward_roles(member, level):
+    """Grant every earned reward role the member is missing, returns the roles granted"""
+    missing = get_missing_reward_roles(member, level)
+    if not missing:
+        return []
+    try:
+        await member.add_roles(*missing, reason=f"Aetherius rank reward (level {level})")
+    except Exception as e:
+        print(f"❌ Error assigning roles: {e}")
+        return []
+    return missing
+
+async def resolve_member(guild, user):
+    """Return the user as a guild Member, fetching it when the member cache does not hold it"""
+    if isinstance(user, discord.Member):
+        return user
+    member = guild.get_member(user.id)
+    if member is None:
+        try:
+            member = await guild.fetch_member(user.id)
+        except discord.HTTPException:
+            return None
+    return member
+
+async def guild_member_batches(guild):
+    """Yield the guild's human members from the cache, or paged over REST in memory-lean mode"""
+    if not MEMORY_LEAN:
+        members = [m for m in guild.members if not m.bot]
+        if members:
+            yield members
+        return
+    
+    batch = []
+    async for member in guild.fetch_members(limit=None):
+        if not member.bot:
+            batch.append(member)
+        if len(batch) >= MEMBER_FETCH_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def member_cache_report():
+    """Per guild: (guild, cached members, total members, estimated bytes not spent on the cache)"""
+    report = []
+    for guild in bot.guilds:
+        total = guild.member_count or 0
+        cached = len(guild.members)
+        report.append((guild, cached, total, max(0, total - cached) * MEMBER_CACHE_BYTES))
+    return report
+
+async def reconcile_guild_roles(guild):
+    """Diff every member's earned rank roles against their current roles and apply the changes"""
+    reconciled = 0
+    try:
+        async for members in guild_member_batches(guild):
+            conn = None
+            try:
+                conn = await get_db_connection(read_only=True)
+                c = conn.cursor()
+                execute_query(c, 'member_levels', (guild.id, [m.id for m in members]))
+                levels = {row['user_id']: row['level'] for row in c.fetchall()}
+            except Exception as e:
+                print(f"❌ Error loading levels for role reconciliation: {e}")
+                if conn:
+                    conn.rollback()
+                return reconciled
+            finally:
+                if conn:
+                    release_db_connection(conn)
+
+            changes = []
+            for member in members:
+                if member.id in levels:
+                    missing = get_missing_reward_roles(member, levels[member.id])
+                    unearned = get_unearned_reward_roles(member, levels[member.id])
+                    if missing or unearned:
+                        changes.append((member, missing, unearned))
+
+            for start in range(0, len(changes), ROLE_SYNC_BATCH_SIZE):
+                for member, missing, unearned in changes[start:start + ROLE_SYNC_BATCH_SIZE]:
+                    try:
+                        if missing:
+                            await member.add_roles(*missing, reason="Aetherius rank reconciliation")
+                        if unearned:
+                            await member.remove_roles(*unearned, reason="Aetherius rank reconciliation")
+                    except Exception as e:
+                        print(f"❌ Error reconciling roles for {member}: {e}")
+                await asyncio.sleep(ROLE_SYNC_BATCH_DELAY)
+            reconciled += len(changes)
+    except discord.HTTPException as e:
+        print(f"❌ Error fetching members of {guild.name} for role reconciliation: {e}")
+
+    if reconciled:
+        print(f"🎖️ Reconciled rank roles for {reconciled} members in {guild.name}")
+    return reconciled
+
+async def rollover_season():
+    """End the running season once it is SEASON_LENGTH_DAYS old; returns the new season number or None"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'end_season', (SEASON_LENGTH_DAYS,))
+        ended = c.fetchone()
+        if not ended:
+            conn.rollback()
+            return None
+        # The new season's partition already exists, so the switch is one row; prepare the next one
+        season = ended['season'] + 1
+        execute_query(c, 'start_season', (season,))
+        create_season_partition(c, season + 1)
+        conn.commit()
+        print(f"🏁 Season {ended['season']} has ended, season {season} begins!")
+        return season
+    except Exception as e:
+        print(f"❌ Error rolling over season: {e}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+async def legacy_users_exist():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = await get_db_connection()
         c = conn.cursor()
+        execute_query(c, 'legacy_users_exist')
+        return c.fetchone()['found']
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+async def migrate_legacy_xp():
+    """Copy the global users table into the guild that inherits it, one short transaction per batch"""
+    try:
+        state = json.loads(await get_bot_meta('guild_xp_migration') or 'null')
+        if state is None:
+            if len(bot.guilds) == 1:
+                state = {'guild_id': bot.guilds[0].id, 'last_user_id': 0, 'done': False}
+            else:
+                if await legacy_users_exist():
+                    # Members who chat meanwhile get unseeded rows that the migration tops up once it runs
+                    print("⚠️ Legacy XP is waiting for a guild: set LEGACY_XP_GUILD_ID to the server that owns it")
+                    return
+                state = {'guild_id': None, 'last_user_id': 0, 'done': True}
+            await set_bot_meta('guild_xp_migration', json.dumps(state))
+    except Exception as e:
+        print(f"❌ Error starting legacy XP migration: {e}")
+        return
+    
+    copied = batches = 0
+    while not state['done']:
+        conn = None
+        try:
+            conn = await get_db_connection()
+            c = conn.cursor()
+            execute_query(c, 'migrate_legacy_users', (state['last_user_id'], LEGACY_XP_BATCH_SIZE, state['guild_id'], LEVEL_MULTIPLIER))
+            batch = c.fetchone()
+            stale = list(batch['moved_ids'])
+            if batch['scanned']:
+                state['last_user_id'] = batch['last_user_id']
+            if batch['scanned'] < LEGACY_XP_BATCH_SIZE:
+                execute_query(c, 'merge_legacy_season_xp', (state['guild_id'],))
+                execute_query(c, 'delete_legacy_season_xp')
+                execute_query(c, 'adopt_legacy_quests', (state['guild_id'], state['guild_id']))
+                stale += [row['user_id'] for row in c.fetchall()]
+                execute_query(c, 'delete_legacy_quests')
+                state['done'] = True
+            # The checkpoint commits with the batch, so a restart resumes without copying anyone twice
+            execute_query(c, 'bot_meta_set', ('guild_xp_migration', json.dumps(state)))
+            conn.commit()
+            for user_id in stale:
+                invalidate_cached_user(user_id)
+            copied += batch['moved']
+            batches += 1
+        except Exception as e:
+            print(f"❌ Error migrating legacy XP, will resume on the next start: {e}")
+            if conn:
+                conn.rollback()
+            return
+        finally:
+            if conn:
+                release_db_connection(conn)
         
+        if state['done']:
+            print(f"✅ Migrated {copied:,} legacy members into guild {state['guild_id']}")
+        else:
+            if batches % 10 == 0:
+                print(f"📦 Migrating legacy XP: {copied:,} members copied, up to user {state['last_user_id']}...")
+            await asyncio.sleep(LEGACY_XP_BATCH_DELAY)
+
+@tasks.loop(seconds=SEASON_CHECK_INTERVAL)
+async def season_rollover():
+    await rollover_season()
+
+@tasks.loop(seconds=ACTIVITY_FLUSH_INTERVAL)
+async def flush_activity_rollups():
+    await flush_activity()
+
+@tasks.loop(seconds=ROLE_SYNC_INTERVAL)
+async def reconcile_reward_roles():
+    """Periodically bring every member's rank roles in line with their level"""
+    for guild in bot.guilds:
+        await reconcile_guild_roles(guild)
+
+@reconcile_reward_roles.before_loop
+async def before_reconcile_reward_roles():
+    await bot.wait_until_ready()
+
+def get_quest_offers(guild_id, today):
+    """Group the guild's quests into the slots open today: slot -> (starts, expires, candidates)"""
+    offers = {}
+    for key, quest in get_guild_config(guild_id)['quest_types'].items():
+        slot = quest.get('slot', 'daily')
+        if slot == 'event':
+            starts, expires = date.fromisoformat(quest['starts']), date.fromisoformat(quest['ends'])
+            if starts <= today <= expires:
+                offers[f"event:{key}"] = (starts, expires, [quest])
+            continue
+        days = QUEST_SLOT_DAYS[slot]
+        starts = today - timedelta(days=(today - QUEST_PERIOD_EPOCH).days % days)
+        offers.setdefault(slot, (starts, starts + timedelta(days=days - 1), []))[2].append(quest)
+    return offers
+
+def quest_slot_label(slot):
+    return "Event" if slot.startswith('event:') else slot.title()
+
+def missing_quest_slots(quests, offers):
+    held = {quest['quest_slot'] for quest in quests}
+    return [slot for slot in offers if slot not in held]
+
+@traced
+async def get_or_assign_quests(guild_id, user_id):
+    """Get the user's active quests in the guild, assigning one for every open slot they do not hold yet"""
+    conn = None
+    try:
         today = date.today()
+        offers = get_quest_offers(guild_id, today)
         
-        # Check if user has a quest for today
-        c.execute('''SELECT * FROM user_quests 
-                     WHERE user_id = %s AND assigned_date = %s''',
-                  (user_id, today))
-        quest = c.fetchone()
-        
-        if quest:
-            return dict(quest)
-        
-        # Assign a new random quest
-        quest_key = random.choice(list(QUEST_TYPES.keys()))
-        quest_data = QUEST_TYPES[quest_key]
-        
-        c.execute('''INSERT INTO user_quests 
-                     (user_id, quest_name, quest_type, quest_description, 
-                      quest_reward, target, assigned_date)
-                     VALUES (%s, %s, %s, %s, %s, %s, %s)
-                     RETURNING *''',
-                  (user_id, quest_data['name'], quest_data['type'],
-                   quest_data['description'], quest_data['reward'],
-                   quest_data['target'], today))
-        
-        new_quest = c.fetchone()
-        conn.commit()
+        quests = get_cached_quests(guild_id, user_id)
+        if quests is not None and not missing_quest_slots(quests, offers):
+            return [dict(quest) for quest in quests]
+        
+        conn = await get_db_connection(read_only=True)
+        c = conn.cursor()
+        
+        execute_query(c, 'active_quests', (guild_id, user_id, today))
+        quests = c.fetchall()
+        if conn.pool_name == 'primary':
+            cache_user_quests(guild_id, user_id, quests, today)
+        
+        missing = missing_quest_slots(quests, offers)
+        if not missing:
+            return [dict(quest) for quest in quests]
+        
+        # Assignment is a write, so it always goes to the primary
+        release_db_connection(conn)
+        conn = None
+        conn = await get_db_connection()
+        c = conn.cursor()
         
-        # Initialize progress tracking
-        c.execute('''INSERT INTO quest_progress (user_id, quest_date)
-                     VALUES (%s, %s)
-                     ON CONFLICT (user_id, quest_date) DO NOTHING''',
-                  (user_id, today))
+        for slot in missing:
+            starts, expires, candidates = offers[slot]
+            quest_data = random.choice(candidates)
+            execute_query(c, 'assign_quest',
+                          (guild_id, user_id, slot, quest_data['name'], quest_data['type'],
+                           quest_data['description'], quest_data['reward'],
+                           quest_data['target'], starts, expires))
+        
+        # Re-read on the primary, which also picks up quests the replica had not seen yet
+        execute_query(c, 'active_quests', (guild_id, user_id, today))
+        quests = c.fetchall()
         conn.commit()
         
-        return dict(new_quest)
+        cache_user_quests(guild_id, user_id, quests, today)
+        return [dict(quest) for quest in quests]
     
     except Exception as e:
-        print(f"❌ Error in get_or_assign_daily_quest: {e}")
+        print(f"❌ Error in get_or_assign_quests: {e}")
         if conn:
             conn.rollback()
         return None
@@ -293,163 +2129,161 @@ async def get_or_assign_daily_quest(user_id):
         if conn:
             release_db_connection(conn)
 
-async def update_quest_progress(user_id, progress_type, value=1, channel_id=None):
-    """Update user's quest progress based on activity"""
+def quests_to_advance(quests, quest_types, value):
+    """Whether any of these quests would move on an event with this value"""
+    return any(quest['quest_type'] in quest_types and not quest['completed']
+               and not (QUEST_HANDLERS[quest['quest_type']]['distinct'] and value in (quest['seen'] or []))
+               for quest in quests)
+
+@traced
+async def update_quest_progress(guild_id, user_id, progress_type, value=1, channel_id=None, day=None):
+    """Advance every quest in the guild active on day (default today) listening to this event, returning those it completed"""
+    event_query = QUEST_EVENT_QUERIES.get(progress_type)
+    if not event_query or guild_id is None:
+        return []
+    query_name, value_count, quest_types = event_query
+    if channel_id is not None:
+        value = channel_id  # Message events are counted per channel
+    value = str(value)
+    
     conn = None
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        
         today = date.today()
+        replay = day is not None and day != today
+        day = day or today
         
-        # Get user's active quest
-        c.execute('''SELECT * FROM user_quests 
-                     WHERE user_id = %s AND assigned_date = %s 
-                     AND completed = FALSE''',
-                  (user_id, today))
-        quest = c.fetchone()
-        
-        if not quest:
-            return False
+        # Skip the round trip when the cache already knows no active quest would move.
+        # The cache only holds today's quests, so events replayed from an earlier day go straight to the UPDATE.
+        quests = get_cached_quests(guild_id, user_id) if not replay else None
+        if quests is not None and not quests_to_advance(quests, quest_types, value):
+            return []
         
-        quest_type = quest['quest_type']
+        conn = await get_db_connection()
+        c = conn.cursor()
         
-        # Update progress based on quest type
-        if quest_type == 'messages' and progress_type == 'message':
-            # Track unique channels for Social Butterfly
-            c.execute('''SELECT unique_channels FROM quest_progress
-                         WHERE user_id = %s AND quest_date = %s''',
-                      (user_id, today))
-            progress = c.fetchone()
-            
-            if progress:
-                channels = progress['unique_channels'] or []
-                if channel_id and str(channel_id) not in channels:
-                    channels.append(str(channel_id))
-                    c.execute('''UPDATE quest_progress
-                                 SET unique_channels = %s, messages_sent = %s
-                                 WHERE user_id = %s AND quest_date = %s''',
-                              (channels, len(channels), user_id, today))
-                    
-                    # Update quest progress
-                    new_progress = len(channels)
-                    c.execute('''UPDATE user_quests
-                                 SET progress = %s, 
-                                     completed = CASE WHEN %s >= target THEN TRUE ELSE FALSE END
-                                 WHERE user_id = %s AND assigned_date = %s''',
-                              (new_progress, new_progress, user_id, today))
-        
-        elif quest_type == 'commands' and progress_type == 'command':
-            # Track unique commands for Arcane Explorer
-            c.execute('''SELECT commands_used FROM quest_progress
-                         WHERE user_id = %s AND quest_date = %s''',
-                      (user_id, today))
-            progress = c.fetchone()
-            
-            if progress:
-                commands = progress['commands_used'] or []
-                if value not in commands:
-                    commands.append(value)
-                    c.execute('''UPDATE quest_progress
-                                 SET commands_used = %s
-                                 WHERE user_id = %s AND quest_date = %s''',
-                              (commands, user_id, today))
-                    
-                    new_progress = len(commands)
-                    c.execute('''UPDATE user_quests
-                                 SET progress = %s,
-                                     completed = CASE WHEN %s >= target THEN TRUE ELSE FALSE END
-                                 WHERE user_id = %s AND assigned_date = %s''',
-                              (new_progress, new_progress, user_id, today))
-        
-        elif quest_type == 'reactions' and progress_type == 'reaction':
-            # Track reactions for Reaction Master
-            c.execute('''UPDATE quest_progress
-                         SET reactions_added = reactions_added + 1
-                         WHERE user_id = %s AND quest_date = %s''',
-                      (user_id, today))
-            
-            c.execute('''UPDATE user_quests
-                         SET progress = progress + 1,
-                             completed = CASE WHEN progress + 1 >= target THEN TRUE ELSE FALSE END
-                         WHERE user_id = %s AND assigned_date = %s''',
-                      (user_id, today))
-        
-        elif quest_type == 'voice' and progress_type == 'voice':
-            # Track voice time for Voice of Arcadia
-            c.execute('''UPDATE quest_progress
-                         SET voice_time = voice_time + %s
-                         WHERE user_id = %s AND quest_date = %s''',
-                      (value, user_id, today))
-            
-            c.execute('''SELECT voice_time FROM quest_progress
-                         WHERE user_id = %s AND quest_date = %s''',
-                      (user_id, today))
-            progress = c.fetchone()
-            
-            if progress:
-                total_time = progress['voice_time']
-                c.execute('''UPDATE user_quests
-                             SET progress = %s,
-                                 completed = CASE WHEN %s >= target THEN TRUE ELSE FALSE END
-                             WHERE user_id = %s AND assigned_date = %s''',
-                          (total_time, total_time, user_id, today))
-        
-        elif quest_type == 'help' and progress_type == 'help':
-            # Track help given for Guardian's Wisdom
-            c.execute('''UPDATE quest_progress
-                         SET help_given = TRUE
-                         WHERE user_id = %s AND quest_date = %s''',
-                      (user_id, today))
-            
-            c.execute('''UPDATE user_quests
-                         SET progress = 1, completed = TRUE
-                         WHERE user_id = %s AND assigned_date = %s''',
-                      (user_id, today))
-        
-        elif quest_type == 'late_night' and progress_type == 'late_night':
-            # Track late night activity for Night Watch
-            c.execute('''UPDATE quest_progress
-                         SET late_night_active = TRUE
-                         WHERE user_id = %s AND quest_date = %s''',
-                      (user_id, today))
-            
-            c.execute('''UPDATE user_quests
-                         SET progress = 1, completed = TRUE
-                         WHERE user_id = %s AND assigned_date = %s''',
-                      (user_id, today))
+        if quests is None and not replay:
+            # Learn the user's quests once so later events can be answered from the cache
+            execute_query(c, 'active_quests', (guild_id, user_id, today))
+            quests = c.fetchall()
+            cache_user_quests(guild_id, user_id, quests, today)
+            if not quests_to_advance(quests, quest_types, value):
+                return []
         
+        execute_query(c, query_name, (value,) * value_count + (guild_id, user_id, day, day))
+        advanced = c.fetchall()
         conn.commit()
+        merge_cached_quests(guild_id, user_id, advanced)
         
-        # Check if quest just completed
-        c.execute('''SELECT * FROM user_quests 
-                     WHERE user_id = %s AND assigned_date = %s''',
-                  (user_id, today))
-        updated_quest = c.fetchone()
-        
-        return updated_quest['completed'] if updated_quest else False
+        return [dict(quest) for quest in advanced if quest['completed']]
         
     except Exception as e:
         print(f"❌ Error in update_quest_progress: {e}")
         if conn:
             conn.rollback()
-        return False
+        invalidate_cached_user(user_id)
+        return []
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+def record_startup_phase(name):
+    """Record how long the startup phase that just finished took"""
+    global startup_mark
+    now = time.perf_counter()
+    startup_timings[name] = now - startup_mark
+    startup_mark = now
+
+async def get_bot_meta(key):
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'bot_meta_get', (key,))
+        row = c.fetchone()
+        return row['value'] if row else None
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+async def set_bot_meta(key, value):
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'bot_meta_set', (key, value))
+        conn.commit()
     finally:
         if conn:
             release_db_connection(conn)
 
+def get_command_tree_hash():
+    """Hash the payload Discord would receive for the global command tree"""
+    payload = sorted((cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands()),
+                     key=lambda cmd: (cmd.get('type', 1), cmd['name']))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_command_tree(force=False):
+    """Push the command tree to Discord only when its definition changed since the last sync"""
+    key = f"command_tree_hash:{bot.application_id}"
+    tree_hash = get_command_tree_hash()
+    if not force and await get_bot_meta(key) == tree_hash:
+        print("⚔️ Slash commands unchanged since last sync, skipping")
+        return None
+    
+    synced = await bot.tree.sync()
+    await set_bot_meta(key, tree_hash)
+    print(f"⚔️ Synced {len(synced)} slash commands successfully!")
+    return synced
+
 @bot.event
-async def on_ready():
-    print(f'✨ Aetherius | The Eternal Sentry has awakened in Arcadia!')
-    print(f'Guardian ID: {bot.user.id}')
-    init_db()
+async def setup_hook():
+    """Runs once per process after login, before the gateway connects"""
+    record_startup_phase("Login")
+    
+    await load_guild_configs()
+    record_startup_phase("Guild configs")
+    
+    await load_runtime_snapshot()
+    record_startup_phase("Runtime snapshot")
     
     try:
-        synced = await bot.tree.sync()
-        print(f"⚔️ Synced {len(synced)} slash commands successfully!")
+        await sync_command_tree()
     except Exception as e:
         print(f"❌ Failed to sync commands: {e}")
+    record_startup_phase("Command sync")
+
+@bot.event
+async def on_ready():
+    global loop_lag_task, legacy_migration_task
+    print(f'✨ Aetherius | The Eternal Sentry has awakened in Arcadia!')
+    print(f'Guardian ID: {bot.user.id}')
     
+    # on_ready fires again after every reconnect; only the first one ends startup
+    if "Gateway ready" not in startup_timings:
+        record_startup_phase("Gateway ready")
+        report = " • ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in startup_timings.items())
+        print(f"⏱️ Startup: {report} • total {sum(startup_timings.values()):.2f}s")
+        reconcile_runtime_state()
+        legacy_migration_task = asyncio.create_task(migrate_legacy_xp())
+        if MEMORY_LEAN:
+            for guild, cached, total, saved in member_cache_report():
+                print(f"🪶 {guild.name}: {cached:,}/{total:,} members cached • ~{format_bytes(saved)} saved")
+
+    if not reconcile_reward_roles.is_running():
+        reconcile_reward_roles.start()
+    if not refresh_guild_configs.is_running():
+        refresh_guild_configs.start()
+    if SEASON_LENGTH_DAYS > 0 and not season_rollover.is_running():
+        season_rollover.start()
+    if not snapshot_runtime_state.is_running():
+        snapshot_runtime_state.start()
+    if not flush_activity_rollups.is_running():
+        flush_activity_rollups.start()
+    if loop_lag_task is None:
+        loop_lag_task = asyncio.create_task(monitor_loop_lag())
+        start_blocking_watchdog()
+        start_trace_exporter()
+
     await bot.change_presence(
         activity=discord.Activity(
             type=discord.ActivityType.watching,
@@ -458,7 +2292,98 @@ async def on_ready():
     )
 
 @bot.event
+async def on_guild_role_create(role):
+    build_role_index(role.guild)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    build_role_index(after.guild)
+
+@bot.event
+async def on_guild_role_delete(role):
+    build_role_index(role.guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    role_index.pop(guild.id, None)
+    welcome_channels.pop(guild.id, None)
+
+def get_welcome_channel(guild):
+    """Resolve the guild's welcome channel once and cache it until channels change"""
+    if guild.id not in welcome_channels:
+        welcome_channel = None
+        for channel_name in WELCOME_CHANNEL_NAMES:
+            welcome_channel = discord.utils.get(guild.text_channels, name=channel_name)
+            if welcome_channel:
+                break
+        welcome_channels[guild.id] = welcome_channel
+    return welcome_channels[guild.id]
+
+def is_join_flood(guild_id, now):
+    """Record a join and report whether the guild is above the burst threshold"""
+    joins = recent_joins[guild_id]
+    joins.append(now)
+    while joins and now - joins[0] > WELCOME_BURST_WINDOW:
+        joins.popleft()
+    return len(joins) > WELCOME_BURST_THRESHOLD
+
+async def send_welcome_digests(guild):
+    """Send one digest embed per interval while a join flood continues"""
+    try:
+        while True:
+            await asyncio.sleep(WELCOME_DIGEST_INTERVAL)
+            arrivals = pending_welcomes.pop(guild.id, [])
+            if not arrivals:
+                break
+            
+            welcome_channel = get_welcome_channel(guild)
+            if not welcome_channel:
+                continue
+            
+            mentions = " ".join(m.mention for m in arrivals[:WELCOME_DIGEST_MENTIONS])
+            if len(arrivals) > WELCOME_DIGEST_MENTIONS:
+                mentions += f" and **{len(arrivals) - WELCOME_DIGEST_MENTIONS}** more"
+            
+            embed = discord.Embed(
+                title=f"🌟 {len(arrivals)} New Guardians Arrived",
+                description=f"🏰 **The gates of Arcadia swing wide!**\n\nWelcome, {mentions}, to **Guardian of Arcadia**! May the floating isles guide your journey.",
+                color=0x00CED1
+            )
+            embed.set_footer(text=f"{guild.member_count} Guardians strong • May the Arcane guide you")
+            
+            try:
+                await welcome_channel.send(embed=embed)
+            except Exception as e:
+                print(f"❌ Error sending welcome digest: {e}")
+    finally:
+        welcome_digest_tasks.pop(guild.id, None)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    welcome_channels.pop(channel.guild.id, None)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    welcome_channels.pop(after.guild.id, None)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    welcome_channels.pop(channel.guild.id, None)
+
+@bot.event
+@traced
 async def on_member_join(member):
+    welcome_channel = get_welcome_channel(member.guild)
+    if not welcome_channel:
+        return
+    
+    guild_id = member.guild.id
+    if is_join_flood(guild_id, datetime.now().timestamp()) or guild_id in welcome_digest_tasks:
+        pending_welcomes[guild_id].append(member)
+        if guild_id not in welcome_digest_tasks:
+            welcome_digest_tasks[guild_id] = asyncio.create_task(untraced(send_welcome_digests(member.guild)))
+        return
+    
     welcome_messages = [
         f"🏰 **Hark! A new soul enters the realm!**\n\nWelcome, {member.mention}, to **Guardian of Arcadia**! The floating isles shimmer with ancient magic as you step into our mystical domain. May your journey be filled with wonder and glory!",
         
@@ -467,26 +2392,18 @@ async def on_member_join(member):
         f"✨ **The Ancient Guardians sense a new presence...**\n\nGreetings, {member.mention}! The winds of fate have carried you to our floating sanctuaries. Welcome to **Guardian of Arcadia**, where adventure awaits among the clouds!",
     ]
     
-    welcome_channel = None
-    possible_channels = ['welcome', 'general', 'gatehouse', 'entrance', 'lobby']
-    
-    for channel_name in possible_channels:
-        welcome_channel = discord.utils.get(member.guild.text_channels, name=channel_name)
-        if welcome_channel:
-            break
+    embed = discord.Embed(
+        title="🌟 A New Guardian Arrives",
+        description=random.choice(welcome_messages),
+        color=0x00CED1
+    )
+    embed.set_thumbnail(url=member.display_avatar.url)
+    embed.set_footer(text=f"Member #{member.guild.member_count} • May the Arcane guide you")
     
-    if welcome_channel:
-        embed = discord.Embed(
-            title="🌟 A New Guardian Arrives",
-            description=random.choice(welcome_messages),
-            color=0x00CED1
-        )
-        embed.set_thumbnail(url=member.display_avatar.url)
-        embed.set_footer(text=f"Member #{member.guild.member_count} • May the Arcane guide you")
-        
-        await welcome_channel.send(embed=embed)
+    await welcome_channel.send(embed=embed)
 
 @bot.event
+@traced
 async def on_voice_state_update(member, before, after):
     """Track voice channel activity for quests"""
     if member.bot:
@@ -506,19 +2423,38 @@ async def on_voice_state_update(member, before, after):
             time_spent = int(current_time - join_time)
             
             # Update quest progress
-            await update_quest_progress(member.id, 'voice', time_spent)
+            await update_quest_progress(member.guild.id, member.id, 'voice', time_spent)
             
             del voice_tracking[member.id]
 
 @bot.event
+@traced
 async def on_reaction_add(reaction, user):
     """Track reactions for quests"""
-    if user.bot:
+    if user.bot or not reaction.message.guild:
         return
     
-    await update_quest_progress(user.id, 'reaction')
+    await update_quest_progress(reaction.message.guild.id, user.id, 'reaction')
+
+async def expire_crystal(guild_id, crystal_msg, delay):
+    """Fade the guild's crystal after the delay unless it was claimed first"""
+    await asyncio.sleep(delay)
+    crystal = crystals.get(guild_id)
+    if crystal and crystal['active'] and crystal['message_id'] == crystal_msg.id:
+        crystal['active'] = False
+        expired_embed = discord.Embed(
+            title="💎 Crystal Shard Vanished",
+            description="The Crystal Shard has faded back into the Arcane mists...",
+            color=0x808080
+        )
+        try:
+            await crystal_msg.edit(embed=expired_embed)
+        except:
+            pass
+        del crystals[guild_id]
 
 @bot.event
+@traced
 async def on_message(message):
     global message_counter, crystals
     
@@ -529,48 +2465,42 @@ async def on_message(message):
         return
     
     guild_id = message.guild.id
+    config = get_guild_config(guild_id)
     message_counter[guild_id] += 1
+    record_activity(guild_id, message.channel.id)
     
-    # Crystal drop logic
-    if message_counter[guild_id] >= CRYSTAL_DROP_CHANCE and guild_id not in crystals:
+    # Crystal drop logic. A shed drop still restarts the count, so each skipped drop is counted once
+    drop_due = message_counter[guild_id] >= config['crystal_drop_chance'] and guild_id not in crystals
+    if drop_due:
         message_counter[guild_id] = 0
-        
+    if drop_due and not should_shed(1, 'crystal_drops_skipped'):
         embed = discord.Embed(
             title="💎 CRYSTAL SHARD DISCOVERED!",
             description="A mystical **Crystal Shard** has appeared! Type `!claim` in this channel to collect it and gain **100 bonus XP**!",
             color=0x00FFFF
         )
-        embed.set_footer(text="First to claim wins! ⚡ Expires in 30 seconds")
+        embed.set_footer(text=f"First to claim wins! ⚡ Expires in {CRYSTAL_LIFETIME} seconds")
         
         crystal_msg = await message.channel.send(embed=embed)
         crystals[guild_id] = {
             'active': True,
             'message_id': crystal_msg.id,
-            'channel_id': message.channel.id
+            'channel_id': message.channel.id,
+            'expires_at': datetime.now().timestamp() + CRYSTAL_LIFETIME
         }
         
-        await asyncio.sleep(30)
-        if guild_id in crystals and crystals[guild_id]['active']:
-            crystals[guild_id]['active'] = False
-            expired_embed = discord.Embed(
-                title="💎 Crystal Shard Vanished",
-                description="The Crystal Shard has faded back into the Arcane mists...",
-                color=0x808080
-            )
-            try:
-                await crystal_msg.edit(embed=expired_embed)
-            except:
-                pass
-            del crystals[guild_id]
+        run_in_background(expire_crystal(guild_id, crystal_msg, CRYSTAL_LIFETIME))
     
     content_lower = message.content.lower()
     
+    defer_quests = should_shed(2, 'quest_updates_deferred')
+    
     if 'lore' in content_lower or '@new' in content_lower or 'welcome' in content_lower:
-        await update_quest_progress(message.author.id, 'help')
+        await record_quest_progress(guild_id, message.author.id, 'help', defer=defer_quests)
     
     current_hour = datetime.now().hour
     if current_hour >= 22 or current_hour < 6:  # 10 PM to 6 AM
-        await update_quest_progress(message.author.id, 'late_night')
+        await record_quest_progress(guild_id, message.author.id, 'late_night', defer=defer_quests)
     
     keywords = {
         "greetings guardian": "🛡️ Greetings, brave soul! The Guardians watch over you.",
@@ -588,18 +2518,24 @@ async def on_message(message):
     
     for keyword, response in keywords.items():
         if keyword in content_lower:
-            if current_time - keyword_cooldowns.get(user_id, 0) >= KEYWORD_COOLDOWN:
+            if (current_time - keyword_cooldowns.get(user_id, 0) >= config['keyword_cooldown']
+                    and not should_shed(1, 'keyword_replies_skipped')):
                 await message.channel.send(response)
                 keyword_cooldowns[user_id] = current_time
             break
     
-    await update_quest_progress(message.author.id, 'message', channel_id=message.channel.id)
+    await record_quest_progress(guild_id, message.author.id, 'message', channel_id=message.channel.id, defer=defer_quests)
     
-    await process_xp(message)
+    # In stage 3 only a sample of messages earn XP; the cooldown already caps chatty members
+    if load_shed_state['stage'] < 3 or random.random() < XP_SAMPLE_RATE:
+        await process_xp(message)
+    else:
+        load_shed_stats['messages_sampled_out_of_xp'] += 1
     
     await bot.process_commands(message)
 
 @bot.command(name='claim')
+@traced
 async def claim_crystal(ctx):
     global crystals
 
@@ -617,34 +2553,31 @@ async def claim_crystal(ctx):
 
     conn = None
     try:
-        conn = get_db_connection()
+        conn = await get_db_connection()
         c = conn.cursor()
 
-        c.execute('SELECT xp, level, crystal_shards FROM users WHERE user_id = %s', (ctx.author.id,))
-        row = c.fetchone()
+        row = get_cached_member(guild_id, ctx.author.id)
+        if not row:
+            execute_query(c, 'member_crystal_state', (guild_id, ctx.author.id))
+            row = c.fetchone()
 
         if row:
-            xp, level, shards = row['xp'], row['level'], row['crystal_shards']
-            new_xp = xp + 100
-            new_level = get_user_level(new_xp)
-            c.execute(
-                'UPDATE users SET xp = %s, level = %s, crystal_shards = %s WHERE user_id = %s',
-                (new_xp, new_level, shards + 1, ctx.author.id)
-            )
-            
-            if new_level > level:
-                conn.commit()
-                await handle_level_up(ctx.message, new_level)
+            execute_query(c, 'update_member_crystals', (100, 100, LEVEL_MULTIPLIER, guild_id, ctx.author.id))
+            written_row = c.fetchone()
+            leveled_up = written_row['level'] > get_user_level(written_row['xp'] - 100)
         else:
-            c.execute(
-                '''INSERT INTO users
-                   (user_id, username, xp, level, last_message, total_messages,
-                    crystal_shards, blessings_given, blessings_received)
-                   VALUES (%s, %s, 100, 1, %s, 0, 1, 0, 0)''',
-                (ctx.author.id, str(ctx.author), datetime.now().timestamp())
-            )
+            execute_query(c, 'insert_member', (guild_id, ctx.author.id, str(ctx.author), 100, datetime.now().timestamp(), 0, 1, 0, 0, LEVEL_MULTIPLIER))
+            written_row = c.fetchone()
+            leveled_up = False
+        add_season_xp(c, guild_id, ctx.author.id, 100)
 
         conn.commit()
+        cache_member_row(written_row)
+        shards = written_row['crystal_shards']
+        unlocked = reached_achievements('crystal_shards', shards - 1, shards)
+        
+        if leveled_up:
+            await handle_level_up(ctx.message, written_row['level'])
 
         embed = discord.Embed(
             title="💎 CRYSTAL SHARD CLAIMED!",
@@ -653,6 +2586,7 @@ async def claim_crystal(ctx):
         )
         embed.set_thumbnail(url=ctx.author.display_avatar.url)
         await ctx.send(embed=embed)
+        await announce_achievements(ctx.channel, ctx.author, unlocked)
         
         if guild_id in crystals:
             del crystals[guild_id]
@@ -661,10 +2595,12 @@ async def claim_crystal(ctx):
         print(f"❌ Error in claim_crystal: {e}")
         if conn:
             conn.rollback()
+        invalidate_cached_user(ctx.author.id)
     finally:
         if conn:
             release_db_connection(conn)
 
+@traced
 async def process_xp(message):
     if message.author.bot or not message.guild:
         return
@@ -673,64 +2609,69 @@ async def process_xp(message):
     user_id = message.author.id
     current_time = datetime.now().timestamp()
     cooldown_key = (guild_id, user_id)
+    config = get_guild_config(guild_id)
     
     if cooldown_key in xp_cooldowns:
-        if current_time - xp_cooldowns[cooldown_key] < XP_COOLDOWN:
+        if current_time - xp_cooldowns[cooldown_key] < config['xp_cooldown']:
             return
 
     conn = None
     try:
-        conn = get_db_connection()
+        conn = await get_db_connection()
         c = conn.cursor()
 
-        c.execute('SELECT xp, level, last_message, total_messages FROM users WHERE user_id = %s', (user_id,))
-        row = c.fetchone()
+        row = get_cached_member(guild_id, user_id)
+        if not row:
+            execute_query(c, 'member_xp_state', (guild_id, user_id))
+            row = c.fetchone()
 
         if row:
-            xp, level, last_message, total_messages = row['xp'], row['level'], row['last_message'], row['total_messages']
-
-            if last_message and current_time - last_message < XP_COOLDOWN:
+            last_message = row['last_message']
+            if last_message and current_time - last_message < config['xp_cooldown']:
                 xp_cooldowns[cooldown_key] = last_message
                 return
 
-            new_xp = xp + XP_PER_MESSAGE
-            new_level = get_user_level(new_xp)
-
-            c.execute(
-                '''UPDATE users
-                   SET xp = %s, level = %s, last_message = %s, total_messages = %s, username = %s
-                   WHERE user_id = %s''',
-                (new_xp, new_level, current_time, total_messages + 1, str(message.author), user_id)
-            )
+            gain = config['xp_per_message']
+            execute_query(c, 'update_member_message_xp', (gain, gain, LEVEL_MULTIPLIER, current_time, str(message.author), guild_id, user_id))
+            updated_row = c.fetchone()
+            add_season_xp(c, guild_id, user_id, gain)
 
             conn.commit()
+            cache_member_row(updated_row)
             
             xp_cooldowns[cooldown_key] = current_time
 
-            if new_level > level:
-                await handle_level_up(message, new_level)
+            # Compare against this write's own starting point, not the possibly stale cached row
+            if updated_row['level'] > get_user_level(updated_row['xp'] - gain):
+                await handle_level_up(message, updated_row['level'])
+            total_messages = updated_row['total_messages']
+            await announce_achievements(message.channel, message.author,
+                                        reached_achievements('total_messages', total_messages - 1, total_messages))
 
         else:
-            c.execute(
-                '''INSERT INTO users
-                   (user_id, username, xp, level, last_message, total_messages,
-                    crystal_shards, blessings_given, blessings_received)
-                   VALUES (%s, %s, %s, %s, %s, %s, 0, 0, 0)''',
-                (user_id, str(message.author), XP_PER_MESSAGE, 1, current_time, 1)
-            )
+            execute_query(c, 'insert_member', (guild_id, user_id, str(message.author), config['xp_per_message'], current_time, 1, 0, 0, 0, LEVEL_MULTIPLIER))
+            new_row = c.fetchone()
+            add_season_xp(c, guild_id, user_id, config['xp_per_message'])
 
             conn.commit()
+            cache_member_row(new_row)
             
             xp_cooldowns[cooldown_key] = current_time
+            # A row seeded from legacy totals already held the badges below its old count
+            total_messages = new_row['total_messages']
+            await announce_achievements(message.channel, message.author,
+                                        reached_achievements('total_messages', total_messages - 1, total_messages))
     
     except Exception as e:
         print(f"❌ Error in process_xp: {e}")
         if conn:
             conn.rollback()
+        invalidate_cached_user(user_id)
     finally:
         if conn:
             release_db_connection(conn)
 
+@traced
 async def handle_level_up(message, new_level):
     blessing_emoji = "✨"
     for milestone in sorted(LEVEL_BLESSINGS.keys(), reverse=True):
@@ -744,40 +2685,49 @@ async def handle_level_up(message, new_level):
         color=0xFFD700
     )
     
-    if new_level in ROLE_REWARDS:
-        role_name = ROLE_REWARDS[new_level]
-        role = discord.utils.get(message.guild.roles, name=role_name)
-        
-        if role:
-            try:
-                bot_member = message.guild.get_member(bot.user.id)
-                if role < bot_member.top_role:
-                    await message.author.add_roles(role)
-                    embed.add_field(
-                        name="🏆 New Title Bestowed!",
-                        value=f"You have earned the rank of **{role_name}**!",
-                        inline=False
-                    )
-                else:
-                    print(f"⚠️ Cannot assign role {role_name} - role hierarchy issue")
-            except Exception as e:
-                print(f"❌ Error assigning role: {e}")
-    
+    member = await resolve_member(message.guild, message.author)
+    granted_roles = await grant_reward_roles(member, new_level) if member else []
+    if granted_roles:
+        embed.add_field(
+            name="🏆 New Title Bestowed!",
+            value=f"You have earned the rank of **{granted_roles[-1].name}**!",
+            inline=False
+        )
+
     xp_needed = calculate_xp_for_level(new_level + 1) - calculate_xp_for_level(new_level)
     embed.set_footer(text=f"Next rank in {xp_needed} XP • {blessing_emoji} Blessing received")
     
     await message.channel.send(embed=embed)
 
 @bot.tree.command(name="profile", description="View your Guardian profile and stats")
+@traced
 async def profile(interaction: discord.Interaction, member: discord.Member = None):
     target = member or interaction.user
     
     conn = None
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('SELECT * FROM users WHERE user_id = %s', (target.id,))
-        user_data = c.fetchone()
+        guild_id = interaction.guild.id if interaction.guild else None
+        if interaction.guild:
+            target = await resolve_member(interaction.guild, target) or target
+        today = date.today()
+        user_data = get_cached_member(guild_id, target.id)
+        quests = get_cached_quests(guild_id, target.id)
+        
+        if not user_data or quests is None:
+            # One round trip for the row and every active quest; only primary reads are cached
+            conn = await get_db_connection(read_only=True)
+            c = conn.cursor()
+            execute_query(c, 'member_profile', (today, guild_id, target.id))
+            rows = c.fetchall()
+            user_data = None
+            quests = []
+            if rows:
+                user_data = {k: v for k, v in rows[0].items() if k not in QUEST_COLUMNS}
+                quests = [{**{k: row[k] for k in QUEST_COLUMNS}, 'user_id': target.id}
+                          for row in rows if row['quest_id'] is not None]
+                if conn.pool_name == 'primary':
+                    cache_member_row(user_data)
+                    cache_user_quests(guild_id, target.id, quests, today)
         
         if not user_data:
             embed = discord.Embed(
@@ -817,24 +2767,26 @@ async def profile(interaction: discord.Interaction, member: discord.Member = Non
             embed.add_field(name="🙏 Blessings Given", value=f"**{blessings_given}**", inline=True)
             embed.add_field(name="✨ Blessings Received", value=f"**{blessings_received}**", inline=True)
             
-            today = date.today()
-            c.execute('''SELECT * FROM user_quests 
-                         WHERE user_id = %s AND assigned_date = %s''',
-                      (target.id, today))
-            quest = c.fetchone()
+            badges = [f"{ACHIEVEMENTS[key]['emoji']} {ACHIEVEMENTS[key]['name']}" for key in unlocked_achievements(user_data)]
+            achievements_value = " • ".join(badges) if badges else "No achievements yet"
+            upcoming = next_achievement(user_data)
+            if upcoming:
+                key, value = upcoming
+                achievement = ACHIEVEMENTS[key]
+                achievements_value += (f"\nNext: {achievement['emoji']} **{achievement['name']}** • "
+                                       f"`{value:,}/{achievement['threshold']:,}` {ACHIEVEMENT_COUNTERS[achievement['counter']]}")
+            embed.add_field(name="🏅 Achievements", value=achievements_value, inline=False)
             
-            if quest:
-                progress_percent = int((quest['progress'] / quest['target']) * 100) if quest['target'] > 0 else 0
-                status = "✅ Completed!" if quest['completed'] else f"{quest['progress']}/{quest['target']}"
-                claimed_status = " (Claimed)" if quest['claimed'] else ""
+            if quests:
+                lines = []
+                for quest in quests:
+                    status = "✅ Completed!" if quest['completed'] else f"{quest['progress']}/{quest['target']}"
+                    claimed_status = " (Claimed)" if quest['claimed'] else ""
+                    lines.append(f"{quest_slot_label(quest['quest_slot'])}: **{quest['quest_name']}**{claimed_status} • {status}")
                 
-                embed.add_field(
-                    name="🗺️ Today's Quest",
-                    value=f"**{quest['quest_name']}**{claimed_status}\nProgress: {status}",
-                    inline=False
-                )
+                embed.add_field(name="🗺️ Active Quests", value="\n".join(lines), inline=False)
             
-            roles = [r for r in target.roles if r.name != "@everyone"]
+            roles = [r for r in getattr(target, 'roles', []) if r.name != "@everyone"]
             if roles:
                 highest_role = max(roles, key=lambda r: r.position)
                 embed.add_field(name="🎖️ Highest Rank", value=highest_role.mention, inline=False)
@@ -859,8 +2811,10 @@ bless_cooldowns = {}
 BLESS_COOLDOWN = 300
 
 @bot.tree.command(name="bless", description="Bestow a Guardian's Blessing upon another member")
+@app_commands.guild_only()
+@traced
 async def bless(interaction: discord.Interaction, member: discord.Member):
-    await update_quest_progress(interaction.user.id, 'command', 'bless')
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'command', 'bless')
     
     if member.id == interaction.user.id:
         await interaction.response.send_message("You cannot bless yourself, noble Guardian!", ephemeral=True)
@@ -872,7 +2826,7 @@ async def bless(interaction: discord.Interaction, member: discord.Member):
     
     current_time = datetime.now().timestamp()
     if interaction.user.id in bless_cooldowns:
-        time_left = BLESS_COOLDOWN - (current_time - bless_cooldowns[interaction.user.id])
+        time_left = get_guild_config(interaction.guild_id)['bless_cooldown'] - (current_time - bless_cooldowns[interaction.user.id])
         if time_left > 0:
             minutes = int(time_left // 60)
             seconds = int(time_left % 60)
@@ -884,42 +2838,60 @@ async def bless(interaction: discord.Interaction, member: discord.Member):
     
     conn = None
     try:
-        conn = get_db_connection()
+        conn = await get_db_connection()
         c = conn.cursor()
         
         blessing_xp = 25
-        
-        c.execute('SELECT * FROM users WHERE user_id = %s', (interaction.user.id,))
-        giver_data = c.fetchone()
+        guild_id = interaction.guild.id
+        ascended = []
+        written_rows = {}
+        
+        giver_data = get_cached_member(guild_id, interaction.user.id)
+        if not giver_data:
+            execute_query(c, 'member_row', (guild_id, interaction.user.id))
+            giver_data = c.fetchone()
         if giver_data:
-            new_xp = giver_data['xp'] + blessing_xp
-            new_level = get_user_level(new_xp)
-            c.execute('UPDATE users SET xp = %s, level = %s, blessings_given = %s WHERE user_id = %s',
-                      (new_xp, new_level, giver_data['blessings_given'] + 1, interaction.user.id))
+            execute_query(c, 'update_member_blessings_given', (blessing_xp, blessing_xp, LEVEL_MULTIPLIER, guild_id, interaction.user.id))
+            written_rows[interaction.user.id] = c.fetchone()
+            new_level = written_rows[interaction.user.id]['level']
             
-            if new_level > giver_data['level']:
+            if new_level > get_user_level(written_rows[interaction.user.id]['xp'] - blessing_xp):
+                ascended.append((interaction.user, new_level))
                 await interaction.channel.send(f"🎉 {interaction.user.mention} has ascended to **Level {new_level}** through their generosity!")
         else:
-            c.execute('''INSERT INTO users (user_id, username, xp, level, last_message, total_messages, crystal_shards, blessings_given, blessings_received)
-                         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
-                      (interaction.user.id, str(interaction.user), blessing_xp, 1, datetime.now().timestamp(), 0, 0, 1, 0))
-        
-        c.execute('SELECT * FROM users WHERE user_id = %s', (member.id,))
-        receiver_data = c.fetchone()
+            execute_query(c, 'insert_member', (guild_id, interaction.user.id, str(interaction.user), blessing_xp, datetime.now().timestamp(), 0, 0, 1, 0, LEVEL_MULTIPLIER))
+            written_rows[interaction.user.id] = c.fetchone()
+        add_season_xp(c, guild_id, interaction.user.id, blessing_xp)
+        
+        receiver_data = get_cached_member(guild_id, member.id)
+        if not receiver_data:
+            execute_query(c, 'member_row', (guild_id, member.id))
+            receiver_data = c.fetchone()
         if receiver_data:
-            new_xp = receiver_data['xp'] + blessing_xp
-            new_level = get_user_level(new_xp)
-            c.execute('UPDATE users SET xp = %s, level = %s, blessings_received = %s WHERE user_id = %s',
-                      (new_xp, new_level, receiver_data['blessings_received'] + 1, member.id))
+            execute_query(c, 'update_member_blessings_received', (blessing_xp, blessing_xp, LEVEL_MULTIPLIER, guild_id, member.id))
+            written_rows[member.id] = c.fetchone()
+            new_level = written_rows[member.id]['level']
             
-            if new_level > receiver_data['level']:
+            if new_level > get_user_level(written_rows[member.id]['xp'] - blessing_xp):
+                ascended.append((member, new_level))
                 await interaction.channel.send(f"🎉 {member.mention} has ascended to **Level {new_level}** through the blessing!")
         else:
-            c.execute('''INSERT INTO users (user_id, username, xp, level, last_message, total_messages, crystal_shards, blessings_given, blessings_received)
-                         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
-                      (member.id, str(member), blessing_xp, 1, datetime.now().timestamp(), 0, 0, 0, 1))
+            execute_query(c, 'insert_member', (guild_id, member.id, str(member), blessing_xp, datetime.now().timestamp(), 0, 0, 0, 1, LEVEL_MULTIPLIER))
+            written_rows[member.id] = c.fetchone()
+        add_season_xp(c, guild_id, member.id, blessing_xp)
         
         conn.commit()
+        for row in written_rows.values():
+            cache_member_row(row)
+        given = written_rows[interaction.user.id]['blessings_given']
+        received = written_rows[member.id]['blessings_received']
+        unlocked = [
+            (interaction.user, reached_achievements('blessings_given', given - 1, given)),
+            (member, reached_achievements('blessings_received', received - 1, received)),
+        ]
+        
+        for guardian, level in ascended:
+            await grant_reward_roles(guardian, level)
         
         bless_cooldowns[interaction.user.id] = current_time
         
@@ -932,6 +2904,8 @@ async def bless(interaction: discord.Interaction, member: discord.Member):
         embed.set_footer(text="Kindness is the true strength of Arcadia")
         
         await interaction.response.send_message(embed=embed)
+        for guardian, keys in unlocked:
+            await announce_achievements(interaction.channel, guardian, keys)
     
     except discord.Forbidden:
         await interaction.response.send_message(
@@ -950,54 +2924,198 @@ async def bless(interaction: discord.Interaction, member: discord.Member):
         if conn:
             release_db_connection(conn)
 
-@bot.tree.command(name="leaderboard", description="View the top Guardians of Arcadia")
-async def leaderboard(interaction: discord.Interaction):
-    await update_quest_progress(interaction.user.id, 'command', 'leaderboard')
-    
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_TIMEOUT = 180  # Seconds before the page buttons stop responding
+LEADERBOARD_POSITION_CAP = 10000  # "My Position" counts at most this many Guardians ahead of the member
+
+async def fetch_leaderboard_rows(*queries):
+    """Run (name, params) leaderboard queries on one read connection and return their rows in order"""
     conn = None
     try:
-        conn = get_db_connection()
+        conn = await get_db_connection(read_only=True)
         c = conn.cursor()
-        
-        c.execute('''SELECT user_id, username, xp, level 
-                     FROM users 
-                     ORDER BY xp DESC 
-                     LIMIT 10''')
-        top_users = c.fetchall()
-        
-        if not top_users:
-            await interaction.response.send_message("No Guardians have begun their journey yet!", ephemeral=True)
-            return
-        
-        embed = discord.Embed(
-            title="🏆 ARCADIA LEADERBOARD 🏆",
-            description="The mightiest Guardians of the realm!",
-            color=0xFFD700
-        )
+        results = []
+        for name, params in queries:
+            execute_query(c, name, params)
+            results.append([dict(row) for row in c.fetchall()])
+        return results
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+class LeaderboardView(discord.ui.View):
+    """Button-driven guild leaderboard that pages by (xp, user_id) keys instead of OFFSET"""
+    
+    def __init__(self, owner_id, guild_id, season=None):
+        super().__init__(timeout=LEADERBOARD_TIMEOUT)
+        self.owner_id = owner_id
+        self.guild_id = guild_id
+        self.season = season  # seasons row for a seasonal board, None for lifetime XP
+        self.rows = []
+        self.start_rank = 1
+        self.has_next = False
+        self.message = None
+    
+    def set_page(self, rows, start_rank, has_next):
+        self.rows = rows[:LEADERBOARD_PAGE_SIZE]
+        self.start_rank = start_rank
+        self.has_next = has_next
+        self.top_button.disabled = self.prev_button.disabled = start_rank <= 1
+        self.next_button.disabled = not has_next
+    
+    def query(self, name, *params):
+        """The (name, params) pair for a leaderboard query against this board's XP source"""
+        if self.season:
+            return f'season_{name}', (self.season['season'], self.guild_id, *params)
+        return name, (self.guild_id, *params)
+    
+    async def load_first_page(self):
+        (rows,) = await fetch_leaderboard_rows(self.query('leaderboard_first', LEADERBOARD_PAGE_SIZE + 1))
+        self.set_page(rows, 1, len(rows) > LEADERBOARD_PAGE_SIZE)
+    
+    def build_embed(self):
+        if self.season:
+            season = self.season
+            period = f"Began <t:{int(season['started_at'].timestamp())}:D>"
+            if season['ended_at']:
+                period += f" • ended <t:{int(season['ended_at'].timestamp())}:D>"
+            embed = discord.Embed(
+                title=f"🏆 SEASON {season['season']} LEADERBOARD 🏆",
+                description=f"The mightiest Guardians of the season!\n{period}",
+                color=0xFFD700
+            )
+        else:
+            embed = discord.Embed(
+                title="🏆 ARCADIA LEADERBOARD 🏆",
+                description="The mightiest Guardians of the realm!",
+                color=0xFFD700
+            )
         
         medals = ["🥇", "🥈", "🥉"]
         
-        for idx, user in enumerate(top_users):
-            medal = medals[idx] if idx < 3 else f"**{idx + 1}.**"
+        for idx, user in enumerate(self.rows):
+            rank = self.start_rank + idx
+            medal = medals[rank - 1] if rank <= 3 else f"**{rank}.**"
+            marker = " ⬅️" if user['user_id'] == self.owner_id else ""
             embed.add_field(
-                name=f"{medal} {user['username']}",
+                name=f"{medal} {user['username']}{marker}",
                 value=f"Level {user['level']} • {user['xp']:,} XP",
                 inline=False
             )
         
-        embed.set_footer(text="Keep climbing the ranks, Guardian!")
-        await interaction.response.send_message(embed=embed)
+        embed.set_footer(text=f"Ranks {self.start_rank}-{self.start_rank + len(self.rows) - 1} • Keep climbing the ranks, Guardian!")
+        return embed
+    
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Summon your own leaderboard with `/leaderboard`!", ephemeral=True)
+            return False
+        return True
+    
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+    
+    async def show(self, interaction):
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+    
+    async def on_error(self, interaction: discord.Interaction, error, item):
+        print(f"❌ Error in leaderboard page: {error}")
+        if interaction.response.is_done():
+            await interaction.followup.send("⚠️ An error occurred while turning the page.", ephemeral=True)
+        else:
+            await interaction.response.send_message("⚠️ An error occurred while turning the page.", ephemeral=True)
+    
+    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.secondary)
+    async def top_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.load_first_page()
+        await self.show(interaction)
+    
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.primary)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        first = self.rows[0]
+        (rows,) = await fetch_leaderboard_rows(self.query('leaderboard_before', first['xp'], first['user_id'], LEADERBOARD_PAGE_SIZE))
+        if len(rows) < LEADERBOARD_PAGE_SIZE:
+            # Scores moved since this page was drawn; restart from the top rather than misnumber ranks
+            await self.load_first_page()
+        else:
+            self.set_page(rows, max(1, self.start_rank - LEADERBOARD_PAGE_SIZE), True)
+        await self.show(interaction)
+    
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.primary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        last = self.rows[-1]
+        (rows,) = await fetch_leaderboard_rows(self.query('leaderboard_after', last['xp'], last['user_id'], LEADERBOARD_PAGE_SIZE + 1))
+        if rows:
+            self.set_page(rows, self.start_rank + len(self.rows), len(rows) > LEADERBOARD_PAGE_SIZE)
+        else:
+            self.set_page(self.rows, self.start_rank, False)
+        await self.show(interaction)
+    
+    @discord.ui.button(label="My Position", emoji="📍", style=discord.ButtonStyle.success)
+    async def me_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        (position,) = await fetch_leaderboard_rows(self.query('leaderboard_position', self.owner_id, LEADERBOARD_POSITION_CAP))
+        if not position:
+            await interaction.response.send_message("You have not yet begun your journey in Arcadia!", ephemeral=True)
+            return
+        
+        me = position[0]
+        if me['ahead'] >= LEADERBOARD_POSITION_CAP:
+            await interaction.response.send_message(f"📍 You rank below #{LEADERBOARD_POSITION_CAP:,} - keep climbing, Guardian!", ephemeral=True)
+            return
+        above = me['ahead'] % LEADERBOARD_PAGE_SIZE
+        queries = [self.query('leaderboard_from', me['xp'], me['user_id'], LEADERBOARD_PAGE_SIZE - above + 1)]
+        if above:
+            queries.insert(0, self.query('leaderboard_before', me['xp'], me['user_id'], above))
+        pages = await fetch_leaderboard_rows(*queries)
+        rows = [row for page in pages for row in page]
+        
+        self.set_page(rows, me['ahead'] - above + 1, len(rows) > LEADERBOARD_PAGE_SIZE)
+        await self.show(interaction)
+
+@bot.tree.command(name="leaderboard", description="View the top Guardians of Arcadia")
+@app_commands.guild_only()
+@app_commands.describe(season="Season number to rank by XP earned that season (leave empty for all-time XP)")
+@traced
+async def leaderboard(interaction: discord.Interaction, season: app_commands.Range[int, 1] = None):
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'command', 'leaderboard')
+    
+    try:
+        season_row = None
+        if season:
+            (rows,) = await fetch_leaderboard_rows(('season_info', (season,)))
+            if not rows:
+                await interaction.response.send_message(f"Season {season} has not begun yet!", ephemeral=True)
+                return
+            season_row = rows[0]
+        
+        view = LeaderboardView(interaction.user.id, interaction.guild.id, season_row)
+        await view.load_first_page()
+        
+        if not view.rows:
+            await interaction.response.send_message("No Guardians have begun their journey yet!", ephemeral=True)
+            return
+        
+        await interaction.response.send_message(embed=view.build_embed(), view=view)
+        view.message = await interaction.original_response()
     
     except Exception as e:
         print(f"❌ Error in leaderboard: {e}")
-        await interaction.response.send_message("⚠️ An error occurred while fetching the leaderboard.", ephemeral=True)
-    finally:
-        if conn:
-            release_db_connection(conn)
+        # The board may already be on screen if only original_response() failed
+        if interaction.response.is_done():
+            await interaction.followup.send("⚠️ An error occurred while fetching the leaderboard.", ephemeral=True)
+        else:
+            await interaction.response.send_message("⚠️ An error occurred while fetching the leaderboard.", ephemeral=True)
 
 @bot.tree.command(name="prophecy", description="Receive a mystical prophecy from the Arcane")
+@traced
 async def prophecy(interaction: discord.Interaction):
-    await update_quest_progress(interaction.user.id, 'command', 'prophecy')
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'command', 'prophecy')
     
     prophecies = [
         ("fortune", "✨ The crystals shimmer with favor... Great fortune awaits those who dare to reach for the stars!"),
@@ -1022,9 +3140,10 @@ async def prophecy(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="lore", description="Discover the mysteries and lore of Arcadia")
+@traced
 async def lore(interaction: discord.Interaction, topic: str = None):
-    await update_quest_progress(interaction.user.id, 'command', 'lore')
-    await update_quest_progress(interaction.user.id, 'help')
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'command', 'lore')
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'help')
     
     lore_entries = {
         "arcadia": {
@@ -1069,23 +3188,164 @@ async def lore(interaction: discord.Interaction, topic: str = None):
     
     await interaction.response.send_message(embed=embed)
 
+RUNTIME_SNAPSHOT_NAME = 'runtime'
+RUNTIME_SNAPSHOT_INTERVAL = 60  # Seconds between periodic snapshots
+SHUTDOWN_DRAIN_TIMEOUT = 10  # Seconds shutdown waits for in-flight queries to finish
+
+pending_crystals = []  # Restored crystals waiting for the gateway so their expiry can be re-armed
+
+def max_guild_setting(name):
+    """Largest value of a setting across the defaults and every cached guild"""
+    return max([get_guild_config(None)[name]] + [entry['config'][name] for entry in guild_configs.values()])
+
+def encode_runtime_snapshot():
+    """Pack the in-memory runtime state into a compressed snapshot, dropping anything already expired"""
+    now = datetime.now().timestamp()
+    xp_window = max_guild_setting('xp_cooldown')
+    keyword_window = max_guild_setting('keyword_cooldown')
+    bless_window = max_guild_setting('bless_cooldown')
+    
+    state = {
+        'saved_at': now,
+        'crystals': [[guild_id, crystal['channel_id'], crystal['message_id'], crystal['expires_at']]
+                     for guild_id, crystal in crystals.items()
+                     if crystal['active'] and crystal.get('expires_at', 0) > now],
+        'voice_tracking': [[user_id, session['join_time']] for user_id, session in voice_tracking.items()],
+        'xp_cooldowns': [[guild_id, user_id, ts] for (guild_id, user_id), ts in xp_cooldowns.items()
+                         if now - ts < xp_window],
+        'keyword_cooldowns': [[user_id, ts] for user_id, ts in keyword_cooldowns.items() if now - ts < keyword_window],
+        'bless_cooldowns': [[user_id, ts] for user_id, ts in bless_cooldowns.items() if now - ts < bless_window],
+        'message_counter': [[guild_id, count] for guild_id, count in message_counter.items() if count],
+        'member_cache': [[guild_id, user_id] for user_id, entry in user_cache.items()
+                         for guild_id in entry.get('members', ())],
+    }
+    return zlib.compress(json.dumps(state, separators=(',', ':')).encode())
+
+def apply_runtime_snapshot(data):
+    """Restore runtime state from a snapshot, returning the cached (guild_id, user_id) pairs to warm in LRU order"""
+    state = json.loads(zlib.decompress(data))
+    
+    voice_tracking.update({user_id: {'join_time': join_time} for user_id, join_time in state['voice_tracking']})
+    xp_cooldowns.update({(guild_id, user_id): ts for guild_id, user_id, ts in state['xp_cooldowns']})
+    keyword_cooldowns.update({user_id: ts for user_id, ts in state['keyword_cooldowns']})
+    bless_cooldowns.update({user_id: ts for user_id, ts in state['bless_cooldowns']})
+    for guild_id, count in state['message_counter']:
+        message_counter[guild_id] += count
+    pending_crystals.extend(state['crystals'])
+    
+    age = datetime.now().timestamp() - state['saved_at']
+    print(f"♻️ Restored runtime snapshot from {age:.0f}s ago: {len(xp_cooldowns)} XP cooldowns, "
+          f"{len(voice_tracking)} voice sessions, {len(pending_crystals)} crystals")
+    # Snapshots from before per-guild storage cached user ids only and are not warmed
+    return state.get('member_cache', [])[-USER_CACHE_SIZE:]
+
+async def save_runtime_snapshot():
+    conn = None
+    try:
+        data = encode_runtime_snapshot()
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'snapshot_set', (RUNTIME_SNAPSHOT_NAME, psycopg2.Binary(data)))
+        conn.commit()
+        return len(data)
+    except Exception as e:
+        print(f"❌ Error saving runtime snapshot: {e}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+async def load_runtime_snapshot():
+    """Reload the last snapshot and re-read its cached members from the primary in one query"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'snapshot_get', (RUNTIME_SNAPSHOT_NAME,))
+        row = c.fetchone()
+        if not row:
+            return
+        
+        warm_keys = apply_runtime_snapshot(bytes(row['data']))
+        if warm_keys:
+            execute_query(c, 'members_by_key', ([g for g, _ in warm_keys], [u for _, u in warm_keys]))
+            rows = {(member['guild_id'], member['user_id']): member for member in c.fetchall()}
+            for guild_id, user_id in warm_keys:
+                if (guild_id, user_id) in rows:
+                    cache_member_row(rows[(guild_id, user_id)])
+            print(f"♻️ Warmed user cache with {len(rows)} members")
+        conn.rollback()
+    except Exception as e:
+        print(f"❌ Error loading runtime snapshot: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+def reconcile_runtime_state():
+    """Line restored state up with what the gateway reports once guilds are available"""
+    now = datetime.now().timestamp()
+    
+    # Drop voice sessions that ended while we were offline and start ones that began
+    in_voice = {member.id for guild in bot.guilds for channel in guild.voice_channels
+                for member in channel.members if not member.bot}
+    for user_id in list(voice_tracking):
+        if user_id not in in_voice:
+            del voice_tracking[user_id]
+    for user_id in in_voice - voice_tracking.keys():
+        voice_tracking[user_id] = {'join_time': now}
+    
+    for guild_id, channel_id, message_id, expires_at in pending_crystals:
+        channel = bot.get_channel(channel_id)
+        if not channel or expires_at <= now or guild_id in crystals:
+            continue
+        crystals[guild_id] = {
+            'active': True,
+            'message_id': message_id,
+            'channel_id': channel_id,
+            'expires_at': expires_at
+        }
+        run_in_background(expire_crystal(guild_id, channel.get_partial_message(message_id), expires_at - now))
+    pending_crystals.clear()
+
+@tasks.loop(seconds=RUNTIME_SNAPSHOT_INTERVAL)
+async def snapshot_runtime_state():
+    await save_runtime_snapshot()
+
+async def drain_db_connections(timeout=SHUTDOWN_DRAIN_TIMEOUT):
+    """Wait for in-flight handlers to commit and return their connections"""
+    deadline = time.monotonic() + timeout
+    while any(stats['in_use'] for stats in pool_stats.values()):
+        if time.monotonic() >= deadline:
+            print(f"⚠️ Shutting down with {sum(stats['in_use'] for stats in pool_stats.values())} connections still busy")
+            return
+        await asyncio.sleep(0.1)
+
 # Safe shutdown for the bot
 async def shutdown():
     print("🛡️ Shutting down Aetherius...")
-    global connection_pool
-    if connection_pool:
-        connection_pool.closeall()
+    if snapshot_runtime_state.is_running():
+        snapshot_runtime_state.cancel()
+    if flush_activity_rollups.is_running():
+        flush_activity_rollups.cancel()
+    if db_pools:
+        await flush_deferred_quest_progress(force=True)
+        await flush_activity()
+        await drain_db_connections()
+        size = await save_runtime_snapshot()
+        if size is not None:
+            print(f"✅ Runtime snapshot saved ({format_bytes(size)}).")
+        close_db_pools()
         print("✅ Connection pool closed.")
     await bot.close()
 
-# Handle SIGINT/SIGTERM to run shutdown
-import signal
-for sig in (signal.SIGINT, signal.SIGTERM):
-    signal.signal(sig, lambda s, f: asyncio.create_task(shutdown()))
-
 @bot.tree.command(name="rank", description="View all ranks and their XP requirements")
+@traced
 async def rank(interaction: discord.Interaction):
-    await update_quest_progress(interaction.user.id, 'command', 'rank')
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'command', 'rank')
     
     embed = discord.Embed(
         title="🎖️ GUARDIAN RANKS & HIERARCHY",
@@ -1093,7 +3353,7 @@ async def rank(interaction: discord.Interaction):
         color=0xFFD700
     )
     
-    for level, role_name in sorted(ROLE_REWARDS.items()):
+    for level, role_name in sorted(get_guild_config(interaction.guild_id)['role_rewards'].items()):
         xp_needed = calculate_xp_for_level(level)
         embed.add_field(
             name=f"Level {level} - {role_name}",
@@ -1105,147 +3365,128 @@ async def rank(interaction: discord.Interaction):
     
     await interaction.response.send_message(embed=embed)
 
-@bot.tree.command(name="quest", description="View your daily quest and progress")
+@bot.tree.command(name="quest", description="View your active quests and progress")
+@app_commands.guild_only()
+@traced
 async def quest(interaction: discord.Interaction):
-    """View today's quest, progress, and claim rewards"""
-    await update_quest_progress(interaction.user.id, 'command', 'quest')
+    """View your daily, weekly and event quests"""
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'command', 'quest')
     
-    conn = None
     try:
-        # Get or assign today's quest
-        quest_data = await get_or_assign_daily_quest(interaction.user.id)
+        # Get active quests, assigning any open slot the user does not hold yet
+        quests = await get_or_assign_quests(interaction.guild_id, interaction.user.id)
         
-        if not quest_data:
+        if not quests:
             await interaction.response.send_message(
-                "⚠️ Unable to retrieve your quest. Please try again!",
+                "⚠️ Unable to retrieve your quests. Please try again!",
                 ephemeral=True
             )
             return
         
-        # Create embed
-        progress_percent = int((quest_data['progress'] / quest_data['target']) * 100) if quest_data['target'] > 0 else 0
-        progress_bar = create_progress_bar(quest_data['progress'], quest_data['target'], 15)
+        embed = discord.Embed(
+            title="🗺️ ACTIVE QUESTS",
+            description="Complete quests for bonus XP!",
+            color=0x00CED1
+        )
         
-        if quest_data['completed'] and quest_data['claimed']:
-            # Quest already completed and claimed
-            embed = discord.Embed(
-                title="✅ QUEST COMPLETED",
-                description=f"**{quest_data['quest_name']}**\n\n{quest_data['quest_description']}",
-                color=0x808080
-            )
-            embed.add_field(
-                name="Status",
-                value="You've already completed today's quest! Come back tomorrow for a new challenge.",
-                inline=False
-            )
-        elif quest_data['completed'] and not quest_data['claimed']:
-            # Quest completed but not claimed
-            embed = discord.Embed(
-                title="🎉 QUEST COMPLETED!",
-                description=f"**{quest_data['quest_name']}**\n\n{quest_data['quest_description']}",
-                color=0x00FF00
-            )
-            embed.add_field(name="💰 Reward", value=f"+{quest_data['quest_reward']} XP", inline=False)
-            embed.add_field(
-                name="✨ Claim Your Reward",
-                value="Use `/questclaim` to collect your reward!",
-                inline=False
-            )
-        else:
-            # Quest in progress
-            embed = discord.Embed(
-                title="🗺️ DAILY QUEST",
-                description=f"**{quest_data['quest_name']}**\n\n{quest_data['quest_description']}",
-                color=0x00CED1
-            )
-            embed.add_field(name="💰 Reward", value=f"+{quest_data['quest_reward']} XP", inline=True)
-            embed.add_field(name="📊 Progress", value=f"{quest_data['progress']}/{quest_data['target']}", inline=True)
+        for quest_data in quests:
+            if quest_data['completed'] and quest_data['claimed']:
+                status = "✅ Completed and claimed"
+            elif quest_data['completed']:
+                status = f"🎉 Completed! Use `/questclaim` to collect **+{quest_data['quest_reward']} XP**"
+                embed.color = 0x00FF00
+            else:
+                progress_percent = int((quest_data['progress'] / quest_data['target']) * 100) if quest_data['target'] > 0 else 0
+                progress_bar = create_progress_bar(quest_data['progress'], quest_data['target'], 15)
+                status = (f"{progress_bar} {progress_percent}%\n"
+                          f"📊 {quest_data['progress']}/{quest_data['target']} • 💰 +{quest_data['quest_reward']} XP")
+            if quest_data['quest_slot'] != 'daily':
+                status += f" • ends {quest_data['expires_date']}"
+            
             embed.add_field(
-                name="Progress Bar",
-                value=f"{progress_bar} {progress_percent}%",
+                name=f"{quest_slot_label(quest_data['quest_slot'])} • {quest_data['quest_name']}",
+                value=f"{quest_data['quest_description']}\n{status}",
                 inline=False
             )
         
-        embed.set_footer(text=f"Quest resets daily at midnight • {quest_data['assigned_date']}")
+        embed.set_footer(text=f"Daily quests reset at midnight, weekly quests on Monday • {date.today()}")
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
     
     except Exception as e:
         print(f"❌ Error in quest command: {e}")
         await interaction.response.send_message(
-            "⚠️ An error occurred while retrieving your quest.",
+            "⚠️ An error occurred while retrieving your quests.",
             ephemeral=True
         )
 
-@bot.tree.command(name="questclaim", description="Claim your completed quest reward")
+@bot.tree.command(name="questclaim", description="Claim your completed quest rewards")
+@app_commands.guild_only()
+@traced
 async def questclaim(interaction: discord.Interaction):
-    """Claim XP reward for completed quest"""
+    """Claim XP rewards for every completed quest"""
     conn = None
     try:
-        conn = get_db_connection()
+        conn = await get_db_connection()
         c = conn.cursor()
         
         today = date.today()
-        
-        # Get user's quest
-        c.execute('''SELECT * FROM user_quests 
-                     WHERE user_id = %s AND assigned_date = %s''',
-                  (interaction.user.id, today))
-        quest = c.fetchone()
-        
-        if not quest:
-            await interaction.response.send_message(
-                "⚠️ You don't have an active quest today! Use `/quest` to get one.",
-                ephemeral=True
-            )
-            return
-        
-        if not quest['completed']:
-            await interaction.response.send_message(
-                f"⚠️ You haven't completed your quest yet!\n\n**Progress:** {quest['progress']}/{quest['target']}",
-                ephemeral=True
-            )
+        guild_id = interaction.guild.id
+        
+        # Claim every completed quest at once; NOT claimed in the WHERE clause stops double claims
+        execute_query(c, 'claim_quests', (datetime.now(), guild_id, interaction.user.id, today))
+        claimed = c.fetchall()
+        
+        if not claimed:
+            quests = get_cached_quests(guild_id, interaction.user.id)
+            if quests is None:
+                execute_query(c, 'active_quests', (guild_id, interaction.user.id, today))
+                quests = c.fetchall()
+                cache_user_quests(guild_id, interaction.user.id, quests, today)
+            
+            unfinished = [q for q in quests if not q['completed']]
+            if not quests:
+                message = "⚠️ You don't have any active quests! Use `/quest` to get some."
+            elif unfinished:
+                progress = "\n".join(f"**{q['quest_name']}:** {q['progress']}/{q['target']}" for q in unfinished)
+                message = f"⚠️ You haven't completed a quest yet!\n\n{progress}"
+            else:
+                message = "⚠️ You've already claimed all your quest rewards!"
+            await interaction.response.send_message(message, ephemeral=True)
             return
         
-        if quest['claimed']:
-            await interaction.response.send_message(
-                "⚠️ You've already claimed this quest reward!",
-                ephemeral=True
-            )
-            return
+        reward = sum(q['quest_reward'] for q in claimed)
         
-        # Ensure user exists in database before awarding XP
-        c.execute('SELECT xp, level FROM users WHERE user_id = %s', (interaction.user.id,))
-        user = c.fetchone()
+        # Ensure the member exists in this guild before awarding XP
+        user = get_cached_member(guild_id, interaction.user.id)
+        if not user:
+            execute_query(c, 'member_xp_level', (guild_id, interaction.user.id))
+            user = c.fetchone()
         
         if not user:
             # Create user if doesn't exist
-            c.execute('''INSERT INTO users (user_id, username, xp, level)
-                         VALUES (%s, %s, 0, 1)''',
-                      (interaction.user.id, interaction.user.name))
-            conn.commit()
-            user = {'xp': 0, 'level': 1}
-        
-        old_xp = user['xp']
-        old_level = user['level']
-        new_xp = old_xp + quest['quest_reward']
-        new_level = get_user_level(new_xp)
+            execute_query(c, 'insert_member', (guild_id, interaction.user.id, interaction.user.name, 0, None, 0, 0, 0, 0, LEVEL_MULTIPLIER))
+            user = c.fetchone()
         
-        c.execute('''UPDATE users 
-                     SET xp = %s, level = %s 
-                     WHERE user_id = %s''',
-                  (new_xp, new_level, interaction.user.id))
-        
-        c.execute('''UPDATE user_quests 
-                     SET claimed = TRUE, completed_date = %s 
-                     WHERE user_id = %s AND assigned_date = %s''',
-                  (datetime.now(), interaction.user.id, today))
+        execute_query(c, 'update_member_xp', (reward, reward, LEVEL_MULTIPLIER, guild_id, interaction.user.id))
+        updated_user = c.fetchone()
+        add_season_xp(c, guild_id, interaction.user.id, reward)
+        new_xp, new_level = updated_user['xp'], updated_user['level']
+        old_xp = new_xp - reward
+        old_level = get_user_level(old_xp)
         
         conn.commit()
+        cache_member_row(updated_user)
+        merge_cached_quests(guild_id, interaction.user.id, claimed)
+        
+        granted_roles = []
+        if new_level > old_level:
+            granted_roles = await grant_reward_roles(interaction.user, new_level)
         
+        completed_names = "\n".join(f"**{q['quest_name']}** • +{q['quest_reward']} XP" for q in claimed)
         embed = discord.Embed(
-            title="✨ QUEST REWARD CLAIMED!",
-            description=f"**{quest['quest_name']}** completed!\n\nYou've earned **+{quest['quest_reward']} XP**!",
+            title="✨ QUEST REWARD CLAIMED!" if len(claimed) == 1 else "✨ QUEST REWARDS CLAIMED!",
+            description=f"{completed_names}\n\nYou've earned **+{reward} XP**!",
             color=0xFFD700
         )
         embed.add_field(name="Previous XP", value=f"{old_xp:,}", inline=True)
@@ -1254,8 +3495,8 @@ async def questclaim(interaction: discord.Interaction):
         
         if new_level > old_level:
             level_up_text = f"\n\n🎉 **LEVEL UP!** You've reached Level {new_level}!"
-            if new_level in ROLE_REWARDS:
-                level_up_text += f"\n⚔️ New Rank: **{ROLE_REWARDS[new_level]}**"
+            if granted_roles:
+                level_up_text += f"\n⚔️ New Rank: **{granted_roles[-1].name}**"
             embed.add_field(name="Milestone Achieved!", value=level_up_text, inline=False)
         
         embed.set_footer(text="Return tomorrow for a new quest!")
@@ -1265,14 +3506,15 @@ async def questclaim(interaction: discord.Interaction):
         if new_level > old_level:
             level_blessing = LEVEL_BLESSINGS.get(new_level, "⭐")
             announcement = f"{level_blessing} {interaction.user.mention} has ascended to **Level {new_level}** by completing their quest!"
-            if new_level in ROLE_REWARDS:
-                announcement += f"\n⚔️ New Rank Unlocked: **{ROLE_REWARDS[new_level]}**"
+            if granted_roles:
+                announcement += f"\n⚔️ New Rank Unlocked: **{granted_roles[-1].name}**"
             await interaction.channel.send(announcement)
     
     except Exception as e:
         print(f"❌ Error in questclaim: {e}")
         if conn:
             conn.rollback()
+        invalidate_cached_user(interaction.user.id)
         await interaction.response.send_message(
             "⚠️ An error occurred while claiming your reward. Please try again!",
             ephemeral=True
@@ -1282,8 +3524,9 @@ async def questclaim(interaction: discord.Interaction):
             release_db_connection(conn)
 
 @bot.tree.command(name="arcadia", description="Get information about the Guardian of Arcadia server")
+@traced
 async def arcadia(interaction: discord.Interaction):
-    await update_quest_progress(interaction.user.id, 'command', 'arcadia')
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'command', 'arcadia')
     
     embed = discord.Embed(
         title="🏰 Welcome to Guardian of Arcadia",
@@ -1314,8 +3557,9 @@ async def arcadia(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="ranks", description="View all available ranks and their requirements")
+@traced
 async def ranks(interaction: discord.Interaction):
-    await update_quest_progress(interaction.user.id, 'command', 'ranks')
+    await update_quest_progress(interaction.guild_id, interaction.user.id, 'command', 'ranks')
     
     embed = discord.Embed(
         title="⚔️ GUARDIAN RANK HIERARCHY ⚔️",
@@ -1323,7 +3567,7 @@ async def ranks(interaction: discord.Interaction):
         color=0x00CED1
     )
     
-    for level, role_name in sorted(ROLE_REWARDS.items()):
+    for level, role_name in sorted(get_guild_config(interaction.guild_id)['role_rewards'].items()):
         xp_needed = calculate_xp_for_level(level)
         embed.add_field(
             name=f"Level {level} - {role_name}",
@@ -1335,6 +3579,8 @@ async def ranks(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="sync", description="[Admin] Manually sync slash commands")
+@app_commands.guild_only()
+@traced
 async def sync_commands(interaction: discord.Interaction):
     if interaction.user.id != interaction.guild.owner_id:
         await interaction.response.send_message("Only the server owner can sync commands!", ephemeral=True)
@@ -1343,12 +3589,94 @@ async def sync_commands(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
     
     try:
-        synced = await bot.tree.sync()
+        synced = await sync_command_tree(force=True)
         await interaction.followup.send(f"✅ Successfully synced {len(synced)} commands!", ephemeral=True)
     except Exception as e:
         await interaction.followup.send(f"❌ Failed to sync: {str(e)}", ephemeral=True)
 
+ACTIVITY_SHADES = "·░▒▓█"
+
+def render_activity_heatmap(hours, since):
+    """Draw a line per day and a cell per UTC hour, shaded against the busiest hour"""
+    peak = max(hours.values(), default=0)
+    lines = ["       " + "".join(f"{hour:<6}" for hour in range(0, 24, 6)).rstrip()]
+    for day in range(STATS_DAYS):
+        start = since + timedelta(days=day)
+        cells = []
+        for hour in range(24):
+            count = hours.get(start + timedelta(hours=hour), 0)
+            cells.append(ACTIVITY_SHADES[-(-count * (len(ACTIVITY_SHADES) - 1) // peak)] if count else ACTIVITY_SHADES[0])
+        lines.append(f"{start:%a %d} " + "".join(cells))
+    return "```\n" + "\n".join(lines) + "\n```"
+
+@bot.tree.command(name="stats", description="[Admin] View this server's hourly activity and busiest channels")
+@app_commands.guild_only()
+@traced
+async def stats(interaction: discord.Interaction):
+    if interaction.user.id != interaction.guild.owner_id:
+        await interaction.response.send_message("Only the server owner can view activity stats!", ephemeral=True)
+        return
+    
+    conn = None
+    try:
+        guild_id = interaction.guild.id
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        since = today - timedelta(days=STATS_DAYS - 1)
+        
+        # Both reads come from the rollups: at most STATS_DAYS * 24 guild totals, and one daily row per channel
+        conn = await get_db_connection(read_only=True)
+        c = conn.cursor()
+        execute_query(c, 'activity_hours', (guild_id, since))
+        hours = {row['hour']: row['messages'] for row in c.fetchall()}
+        execute_query(c, 'activity_top_channels', (guild_id, since.date(), STATS_TOP_CHANNELS))
+        channels = c.fetchall()
+        total = sum(hours.values())
+        
+        embed = discord.Embed(
+            title=f"📊 {interaction.guild.name} Activity",
+            color=0x00CED1
+        )
+        if not total:
+            embed.description = f"No activity recorded in the last {STATS_DAYS} days yet..."
+        else:
+            by_hour = defaultdict(int)
+            for hour, count in hours.items():
+                by_hour[hour.astimezone(timezone.utc).hour] += count
+            busiest = max(by_hour, key=by_hour.get)
+            
+            embed.description = f"Messages per hour over the last **{STATS_DAYS} days** (UTC)\n" + render_activity_heatmap(hours, since)
+            embed.add_field(name="💬 Messages", value=f"**{total:,}**", inline=True)
+            embed.add_field(name="📅 Daily Average", value=f"**{total / STATS_DAYS:,.0f}**", inline=True)
+            embed.add_field(name="🔥 Busiest Hour", value=f"**{busiest:02d}:00 UTC**", inline=True)
+            embed.add_field(
+                name="🏆 Top Channels",
+                value="\n".join(f"**{rank}.** <#{row['channel_id']}> • {row['messages']:,} messages"
+                                for rank, row in enumerate(channels, 1)),
+                inline=False
+            )
+        embed.set_footer(text=f"Counts are written every {ACTIVITY_FLUSH_INTERVAL}s • {ACTIVITY_SHADES} from quiet to busiest")
+        
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    
+    except Exception as e:
+        await interaction.response.send_message(f"❌ Database error: {str(e)}", ephemeral=True)
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+DBCHECK_TABLES = ['guild_members', 'season_xp', 'user_quests', 'quest_progress', 'activity_rollup', 'activity_daily',
+                  'guild_config', 'bot_meta', 'runtime_snapshot']
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
 @bot.tree.command(name="dbcheck", description="[Admin] Check database health")
+@app_commands.guild_only()
+@traced
 async def dbcheck(interaction: discord.Interaction):
     if interaction.user.id != interaction.guild.owner_id:
         await interaction.response.send_message("Only the server owner can check database health!", ephemeral=True)
@@ -1356,25 +3684,95 @@ async def dbcheck(interaction: discord.Interaction):
     
     conn = None
     try:
-        conn = get_db_connection()
+        conn = await get_db_connection(read_only=True)
+        route = conn.pool_name
         c = conn.cursor()
         
-        c.execute('SELECT COUNT(*) as count FROM users')
-        user_count = c.fetchone()['count']
+        started = time.perf_counter()
+        execute_query(c, 'ping')
+        c.fetchone()
+        round_trip = time.perf_counter() - started
         
-        c.execute('SELECT COUNT(*) as count FROM user_quests')
-        quest_count = c.fetchone()['count']
-        
-        c.execute('SELECT COUNT(*) as count FROM quest_progress')
-        progress_count = c.fetchone()['count']
+        execute_query(c, 'table_stats', (DBCHECK_TABLES,))
+        tables = c.fetchall()
         
         embed = discord.Embed(
             title="💾 Database Health Check",
+            description=f"Report served by the **{route}** • round trip **{round_trip * 1000:.1f} ms**",
             color=0x00FF00
         )
-        embed.add_field(name="Total Users", value=str(user_count), inline=True)
-        embed.add_field(name="Total Quests", value=str(quest_count), inline=True)
-        embed.add_field(name="Progress Records", value=str(progress_count), inline=True)
+        
+        for table in tables:
+            live, dead = table['n_live_tup'], table['n_dead_tup']
+            if route == "replica":
+                # Activity counters are tracked per server, only the primary sees dead tuples
+                dead_text = "n/a on replica"
+            else:
+                dead_text = f"{dead / (live + dead) if live + dead else 0:.1%}"
+            embed.add_field(
+                name=f"📋 {table['relname']}",
+                value=(f"~{table['estimated_rows']:,} rows\n"
+                       f"Table {format_bytes(table['table_size'])} • Index {format_bytes(table['index_size'])}\n"
+                       f"Dead tuples {dead_text}"),
+                inline=True
+            )
+        
+        for name, stats in pool_stats.items():
+            if not stats['checkouts']:
+                continue
+            avg_wait = stats['wait_total'] / stats['checkouts']
+            embed.add_field(
+                name=f"🔌 {name.capitalize()} Pool",
+                value=(f"In use {stats['in_use']}/{DB_POOL_MAX} (peak {stats['peak_in_use']}) • {stats['waiting']} waiting\n"
+                       f"{stats['checkouts']:,} checkouts • {stats['waited']:,} had to wait\n"
+                       f"Wait avg {avg_wait * 1000:.2f} ms • max {stats['wait_max'] * 1000:.1f} ms\n"
+                       f"{stats['timeouts']} timeouts • {stats['errors']} errors • {stats['recycled']} recycled"),
+                inline=True
+            )
+        
+        if os.getenv('DATABASE_REPLICA_URL'):
+            embed.add_field(
+                name="🪞 Replica",
+                value=f"Lag {replica_state['lag']:.1f}s • {'healthy' if replica_state['healthy'] else 'unreachable'}",
+                inline=True
+            )
+        
+        shed = {name: count for name, count in load_shed_stats.items() if count}
+        embed.add_field(
+            name="🚦 Load Shedding",
+            value=(f"Stage {load_shed_state['stage']}/3 • {len(deferred_quest_progress)} users with deferred quests\n"
+                   + ("\n".join(f"{name.replace('_', ' ').capitalize()}: {count:,}" for name, count in shed.items())
+                      or "Nothing shed yet")),
+            inline=True
+        )
+        
+        lookups = user_cache_stats['hits'] + user_cache_stats['misses']
+        embed.add_field(
+            name="🧠 User Cache",
+            value=(f"{len(user_cache):,}/{USER_CACHE_SIZE:,} users • hit rate {user_cache_stats['hits'] / lookups if lookups else 0:.1%}\n"
+                   f"{user_cache_stats['evictions']:,} evictions"),
+            inline=True
+        )
+        
+        if MEMORY_LEAN:
+            report = member_cache_report()
+            embed.add_field(
+                name="🪶 Member Cache (lean)",
+                value=(f"{sum(cached for _, cached, _, _ in report):,}/{sum(total for _, _, total, _ in report):,} members cached\n"
+                       f"~{format_bytes(sum(saved for _, _, _, saved in report))} saved"),
+                inline=True
+            )
+        
+        if loop_lag_samples:
+            ordered = sorted(loop_lag_samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            embed.add_field(
+                name="⏱️ Event Loop Lag",
+                value=(f"Now {loop_lag_samples[-1] * 1000:.1f} ms • p95 {p95 * 1000:.1f} ms\n"
+                       f"Max {ordered[-1] * 1000:.1f} ms over {len(ordered)} samples"),
+                inline=True
+            )
+        
         embed.add_field(name="Status", value="✅ All systems operational", inline=False)
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -1385,6 +3783,190 @@ async def dbcheck(interaction: discord.Interaction):
         if conn:
             release_db_connection(conn)
 
+BLOCKING_REPORT_SIZE = 10
+
+@bot.tree.command(name="blocking", description="[Admin] Show which call sites have blocked the event loop")
+@app_commands.guild_only()
+@app_commands.describe(reset="Clear the collected samples after showing them")
+@traced
+async def blocking(interaction: discord.Interaction, reset: bool = False):
+    if interaction.user.id != interaction.guild.owner_id:
+        await interaction.response.send_message("Only the server owner can inspect the event loop!", ephemeral=True)
+        return
+    
+    with blocking_lock:
+        sites = sorted(blocking_sites.items(), key=lambda item: item[1]['samples'], reverse=True)
+        stalls = blocking_state['stalls']
+        since = blocking_state['sampled_since']
+        if reset:
+            blocking_sites.clear()
+            blocking_state['stalls'] = 0
+            blocking_state['sampled_since'] = time.time()
+    
+    embed = discord.Embed(
+        title="🧭 Event Loop Blocking Report",
+        description=(f"{stalls} stalls over {BLOCKING_THRESHOLD * 1000:.0f} ms since <t:{int(since)}:R>\n"
+                     f"Blocked time is estimated from {BLOCKING_SAMPLE_INTERVAL * 1000:.0f} ms stack samples"),
+        color=0xFFA500 if sites else 0x00FF00
+    )
+    
+    for (call_site, leaf), entry in sites[:BLOCKING_REPORT_SIZE]:
+        embed.add_field(
+            name=f"⛔ {call_site}"[:256],
+            value=(f"~{entry['samples'] * BLOCKING_SAMPLE_INTERVAL * 1000:,.0f} ms blocked past the threshold over {entry['stalls']} stalls\n"
+                   f"Stuck in `{leaf}`\nLast seen <t:{int(entry['last_seen'])}:R>")[:1024],
+            inline=False
+        )
+    
+    if not sites:
+        embed.add_field(name="Status", value="✅ No blocking call sites recorded", inline=False)
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="heap", description="[Admin] Profile memory by allocation site and size the bot's state")
+@app_commands.guild_only()
+@app_commands.describe(action="start or stop tracemalloc, snapshot a baseline, diff against it, or show state sizes",
+                       group="Group allocations by source line or by file")
+@app_commands.choices(
+    action=[app_commands.Choice(name=action, value=action) for action in HEAP_ACTIONS],
+    group=[app_commands.Choice(name="line", value="lineno"), app_commands.Choice(name="file", value="filename")]
+)
+@traced
+async def heap(interaction: discord.Interaction, action: str, group: str = "lineno"):
+    if interaction.user.id != interaction.guild.owner_id:
+        await interaction.response.send_message("Only the server owner can profile memory!", ephemeral=True)
+        return
+    
+    # Snapshots walk every traced allocation, so keep them off the event loop
+    await interaction.response.defer(ephemeral=True)
+    report = await asyncio.to_thread(run_heap_action, action, group)
+    
+    description = "tracemalloc is off"
+    if report['tracing']:
+        description = (f"Tracing since <t:{int(report['started'] or time.time())}:R> • "
+                       f"{format_bytes(report['traced'])} traced (peak {format_bytes(report['traced_peak'])})")
+    embed = discord.Embed(
+        title=f"🧪 Heap Profile • {action}",
+        description=description,
+        color=0xFF0000 if 'error' in report else 0x00CED1
+    )
+    
+    if 'error' in report:
+        embed.add_field(name="⚠️ Error", value=report['error'], inline=False)
+    for stat in report.get('stats', []):
+        if 'size_diff' in stat:
+            value = (f"{'+' if stat['size_diff'] >= 0 else '-'}{format_bytes(abs(stat['size_diff']))} "
+                     f"({stat['count_diff']:+,} blocks) • now {format_bytes(stat['size'])}")
+        else:
+            value = f"{format_bytes(stat['size'])} in {stat['count']:,} blocks"
+        embed.add_field(name=f"📍 {stat['site'][-100:]}", value=value, inline=False)
+    for name, gauge in report.get('gauges', {}).items():
+        value = f"{gauge['entries']:,} entries"
+        if 'bytes' in gauge:
+            value += f" • ~{format_bytes(gauge['bytes'])}"
+        embed.add_field(name=f"📦 {name}", value=value, inline=True)
+    
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+GUILD_SETTING_CHOICES = [app_commands.Choice(name=setting, value=setting) for setting in GUILD_SETTINGS]
+
+def format_guild_setting(value):
+    if isinstance(value, dict):
+        return f"```json\n{json.dumps(value, indent=1)[:900]}\n```"
+    return f"`{value}`"
+
+@bot.tree.command(name="config", description="[Admin] View this server's Aetherius settings")
+@app_commands.guild_only()
+@traced
+async def config_view(interaction: discord.Interaction):
+    if interaction.user.id != interaction.guild.owner_id:
+        await interaction.response.send_message("Only the server owner can view the configuration!", ephemeral=True)
+        return
+    
+    entry = guild_configs.get(interaction.guild_id)
+    overrides = entry['overrides'] if entry else {}
+    config = get_guild_config(interaction.guild_id)
+    
+    embed = discord.Embed(
+        title="⚙️ Aetherius Configuration",
+        description=f"Version {entry['version'] if entry else 0} • ✏️ marks settings overridden for this server",
+        color=0x00CED1
+    )
+    for setting in GUILD_SETTINGS:
+        value = overrides[setting] if setting in overrides else config[setting]
+        if setting == 'quest_types' and setting not in overrides:
+            value = {key: quest['type'] for key, quest in value.items()}
+        marker = "✏️ " if setting in overrides else ""
+        embed.add_field(name=f"{marker}{setting}", value=format_guild_setting(value), inline=GUILD_SETTINGS[setting] is int)
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="configset", description="[Admin] Change one of this server's Aetherius settings")
+@app_commands.guild_only()
+@app_commands.choices(setting=GUILD_SETTING_CHOICES)
+@traced
+async def config_set(interaction: discord.Interaction, setting: app_commands.Choice[str], value: str):
+    if interaction.user.id != interaction.guild.owner_id:
+        await interaction.response.send_message("Only the server owner can change the configuration!", ephemeral=True)
+        return
+    
+    try:
+        parsed = parse_guild_setting(setting.value, value)
+    except (ValueError, TypeError) as e:
+        await interaction.response.send_message(f"⚠️ Invalid value for `{setting.value}`: {e}", ephemeral=True)
+        return
+    
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'upsert_guild_config', (interaction.guild_id, Json({setting.value: parsed})))
+        row = c.fetchone()
+        conn.commit()
+        cache_guild_config(interaction.guild_id, row['settings'], row['version'])
+        
+        await interaction.response.send_message(
+            f"✅ `{setting.value}` updated (config version {row['version']})",
+            ephemeral=True
+        )
+    except Exception as e:
+        print(f"❌ Error in configset: {e}")
+        if conn:
+            conn.rollback()
+        await interaction.response.send_message("⚠️ An error occurred while saving the setting.", ephemeral=True)
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+@bot.tree.command(name="configreset", description="[Admin] Restore one of this server's settings to its default")
+@app_commands.guild_only()
+@app_commands.choices(setting=GUILD_SETTING_CHOICES)
+@traced
+async def config_reset(interaction: discord.Interaction, setting: app_commands.Choice[str]):
+    if interaction.user.id != interaction.guild.owner_id:
+        await interaction.response.send_message("Only the server owner can change the configuration!", ephemeral=True)
+        return
+    
+    conn = None
+    try:
+        conn = await get_db_connection()
+        c = conn.cursor()
+        execute_query(c, 'reset_guild_setting', (setting.value, interaction.guild_id))
+        row = c.fetchone()
+        conn.commit()
+        if row:
+            cache_guild_config(interaction.guild_id, row['settings'], row['version'])
+        
+        await interaction.response.send_message(f"✅ `{setting.value}` restored to its default", ephemeral=True)
+    except Exception as e:
+        print(f"❌ Error in configreset: {e}")
+        if conn:
+            conn.rollback()
+        await interaction.response.send_message("⚠️ An error occurred while resetting the setting.", ephemeral=True)
+    finally:
+        if conn:
+            release_db_connection(conn)
+
 if __name__ == "__main__":
     TOKEN = os.getenv('DISCORD_BOT_TOKEN')
     DATABASE_URL = os.getenv('DATABASE_URL')
@@ -1398,5 +3980,12 @@ if __name__ == "__main__":
     else:
         print("🌐 Starting keep-alive server for Render...")
         keep_alive()
+        # Schema setup runs once, before login and before the event loop exists
+        init_db()
+        record_startup_phase("Database init")
+        # Handle SIGINT/SIGTERM to run shutdown
+        import signal
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda s, f: asyncio.create_task(shutdown()))
         print("🤖 Starting Discord bot with PostgreSQL database...")
         bot.run(TOKEN)
@@ -0,0 +1,148 @@
+"""Stream Aetherius tables to CSV for analysis without loading them into memory.
+
+Rows are read in primary-key order through a named (server-side) cursor, one
+short transaction per chunk, so a large export never pins a long snapshot on
+the database the bot is serving from. After every chunk the last exported key
+is checkpointed next to the output file, and `--resume` continues from there:
+
+    python export.py guild_members members.csv
+    python export.py quest_progress progress.csv --resume
+
+The read replica is used when DATABASE_REPLICA_URL is set.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import date, datetime
+
+import bot
+
+# Table -> primary key columns, exported in key order
+EXPORT_TABLES = {
+    'guild_members': ('guild_id', 'user_id'),
+    'season_xp': ('season', 'guild_id', 'user_id'),
+    'users': ('user_id',),
+    'user_quests': ('quest_id',),
+    'quest_progress': ('id',),
+}
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_FETCH_SIZE = 2000
+
+
+def format_value(value):
+    """Render a column value as a CSV-friendly string"""
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def read_checkpoint(path):
+    """Return the last exported key, row count and file offset, or None without a checkpoint"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_checkpoint(path, last_key, rows, offset):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'last_key': last_key, 'rows': rows, 'offset': offset}, f)
+    os.replace(tmp_path, path)
+
+
+def get_columns(conn, table):
+    c = conn.cursor()
+    c.execute(f'SELECT * FROM {table} LIMIT 0')
+    columns = [col.name for col in c.description]
+    conn.rollback()
+    return columns
+
+
+def export_chunk(conn, table, key, columns, last_key, writer):
+    """Stream one keyset chunk into the writer, returning (rows written, last key)"""
+    c = conn.cursor(name=f'export_{table}')
+    c.itersize = EXPORT_FETCH_SIZE
+    key_sql = ', '.join(key)
+    if last_key is None:
+        c.execute(f'SELECT * FROM {table} ORDER BY {key_sql} LIMIT %s', (EXPORT_CHUNK_SIZE,))
+    else:
+        c.execute(f'SELECT * FROM {table} WHERE ({key_sql}) > %s ORDER BY {key_sql} LIMIT %s',
+                  (tuple(last_key), EXPORT_CHUNK_SIZE))
+
+    rows = 0
+    for row in c:
+        writer.writerow([format_value(row[col]) for col in columns])
+        last_key = [row[col] for col in key]
+        rows += 1
+    c.close()
+    conn.commit()
+    return rows, last_key
+
+
+def export_table(conn, table, out_path, resume=False):
+    key = EXPORT_TABLES[table]
+    checkpoint_path = out_path + '.checkpoint'
+    columns = get_columns(conn, table)
+
+    checkpoint = read_checkpoint(checkpoint_path) if resume else None
+    last_key, total = None, 0
+
+    with open(out_path, 'r+' if checkpoint else 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if checkpoint:
+            # Drop anything written after the checkpoint so no row is exported twice
+            last_key, total = checkpoint['last_key'], checkpoint['rows']
+            if not isinstance(last_key, list):
+                last_key = [last_key]  # Checkpoint written before keys became column lists
+            f.seek(checkpoint['offset'])
+            f.truncate()
+            print(f"⏩ Resuming {table} after {', '.join(key)} {last_key} ({total:,} rows already exported)")
+        else:
+            writer.writerow(columns)
+
+        while True:
+            rows, last_key = export_chunk(conn, table, key, columns, last_key, writer)
+            if not rows:
+                break
+            total += rows
+            f.flush()
+            write_checkpoint(checkpoint_path, last_key, total, f.tell())
+            print(f"📤 Exported {total:,} rows from {table}...")
+            if rows < EXPORT_CHUNK_SIZE:
+                break
+
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream an Aetherius table to CSV")
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('output', help="CSV file to write")
+    parser.add_argument('--resume', action='store_true', help="continue from the last checkpoint")
+    parser.add_argument('--primary', action='store_true', help="read from the primary even if a replica is configured")
+    args = parser.parse_args()
+
+    source = 'replica' if bot.get_database_url('replica') and not args.primary else 'primary'
+    started = time.perf_counter()
+    conn = None
+    try:
+        conn = bot.connect_db(source)
+        total = export_table(conn, args.table, args.output, args.resume)
+        print(f"✅ Exported {total:,} rows from {args.table} ({source}) in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"❌ Export failed: {e}")
+        raise SystemExit(1)
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
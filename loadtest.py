@@ -0,0 +1,507 @@
+"""Load-test Aetherius end to end against a local stand-in for Discord.
+
+A fake gateway (websocket) and REST API run on localhost in their own thread, the
+real bot logs in to them, and traffic is played into the gateway at fixed rates:
+messages, reactions, voice joins/leaves and slash commands. Only DATABASE_URL is
+needed, so it runs offline against a local Postgres. Point it at a scratch
+database, since the bot writes XP and quests as usual:
+
+    python loadtest.py --duration 60 --messages 200 --reactions 20 --voice 5 --interactions 10
+    python loadtest.py --duration 60 --messages 200 --save traffic.jsonl
+    python loadtest.py --replay traffic.jsonl
+
+Saved traffic is JSON lines: a first line {"guild": <GUILD_CREATE payload>}, then
+one {"at": <seconds>, "t": <event>, "d": <payload>} per gateway dispatch.
+
+The report gives the achieved event rate, the time from each frame leaving the
+gateway until the bot's handler finished (or, for slash commands, until the
+interaction callback reached the REST API), REST calls by route, memory and
+event-loop lag.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import discord
+import yarl
+from aiohttp import WSMsgType, web
+
+import bot
+
+FAKE_TOKEN = 'loadtest.fake.token'
+BOT_USER_ID = 900000000000000001
+APPLICATION_ID = 900000000000000002
+GUILD_ID = 900000000000000003
+FIRST_SNOWFLAKE = 910000000000000000
+HEARTBEAT_INTERVAL = 41250  # Milliseconds, as Discord sends it
+READY_TIMEOUT = 60
+RSS_SAMPLE_INTERVAL = 0.5
+
+SAMPLE_MESSAGES = [
+    "anyone around tonight?", "that raid was wild", "gg everyone", "lol", "brb",
+    "has anyone seen the new map", "good morning guardians", "who's up for a run later",
+]
+KEYWORD_MESSAGES = ["hail aetherius", "praise the crystal", "greetings guardian", "by the floating isles"]
+KEYWORD_RATE = 0.05  # Share of synthetic messages that trigger a keyword reply
+REACTION_EMOJIS = ["✨", "⚔️", "🛡️", "💎", "🔥"]
+DEFAULT_COMMANDS = "profile,quest,rank,leaderboard"
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def user_payload(user_id, name, is_bot=False):
+    return {'id': str(user_id), 'username': name, 'discriminator': '0', 'global_name': None,
+            'avatar': None, 'bot': is_bot}
+
+
+def member_payload(user_id, name, roles=()):
+    return {'user': user_payload(user_id, name), 'roles': [str(role) for role in roles],
+            'joined_at': now_iso(), 'deaf': False, 'mute': False, 'flags': 0}
+
+
+def build_guild(members, text_channels, voice_channels):
+    """The GUILD_CREATE payload for a guild with the bot's reward ranks and synthetic members"""
+    snowflake = FIRST_SNOWFLAKE
+    roles = [{'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '0', 'position': 0,
+              'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}]
+    for position, name in enumerate(bot.ROLE_REWARDS.values(), 1):
+        snowflake += 1
+        roles.append({'id': str(snowflake), 'name': name, 'permissions': '0', 'position': position,
+                      'color': 0, 'hoist': False, 'managed': False, 'mentionable': False})
+    snowflake += 1
+    bot_role = snowflake
+    roles.append({'id': str(bot_role), 'name': 'Aetherius', 'permissions': '8', 'position': len(roles),
+                  'color': 0, 'hoist': False, 'managed': True, 'mentionable': False})
+
+    channels = []
+    for index in range(text_channels):
+        snowflake += 1
+        channels.append({'id': str(snowflake), 'type': 0, 'name': 'general' if index == 0 else f'chat-{index}',
+                         'position': index, 'permission_overwrites': [], 'nsfw': False, 'parent_id': None})
+    for index in range(voice_channels):
+        snowflake += 1
+        channels.append({'id': str(snowflake), 'type': 2, 'name': f'Voice {index + 1}', 'position': index,
+                         'permission_overwrites': [], 'bitrate': 64000, 'user_limit': 0, 'parent_id': None})
+
+    member_list = [{**member_payload(BOT_USER_ID, 'Aetherius', [bot_role]),
+                    'user': user_payload(BOT_USER_ID, 'Aetherius', is_bot=True)}]
+    for index in range(members):
+        member_list.append(member_payload(FIRST_SNOWFLAKE + 100000 + index, f'guardian{index}'))
+
+    return {
+        'id': str(GUILD_ID), 'name': 'Load Test Arcadia', 'icon': None, 'owner_id': member_list[1]['user']['id'],
+        'roles': roles, 'channels': channels, 'members': member_list, 'member_count': len(member_list),
+        'large': False, 'unavailable': False, 'presences': [], 'voice_states': [], 'emojis': [],
+        'stickers': [], 'features': [], 'threads': [], 'stage_instances': [], 'guild_scheduled_events': [],
+        'premium_tier': 0, 'verification_level': 0, 'default_message_notifications': 0,
+        'explicit_content_filter': 0, 'mfa_level': 0, 'system_channel_flags': 0, 'preferred_locale': 'en-US',
+        'afk_timeout': 300, 'nsfw_level': 0, 'joined_at': now_iso(),
+    }
+
+
+def generate_traffic(guild, duration, rates, commands, seed):
+    """Build a synthetic schedule of (offset seconds, event, payload), in send order"""
+    rng = random.Random(seed)
+    members = [m for m in guild['members'] if not m['user'].get('bot')]
+    text = [c['id'] for c in guild['channels'] if c['type'] == 0]
+    voice = [c['id'] for c in guild['channels'] if c['type'] == 2]
+
+    schedule = []
+    for kind, rate in rates.items():
+        if rate > 0:
+            schedule += [(i / rate + rng.random() / rate, kind) for i in range(int(rate * duration))]
+    schedule.sort()
+
+    snowflake = FIRST_SNOWFLAKE + 10 ** 9
+    recent_messages = []
+    in_voice = {}
+    events = []
+    for at, kind in schedule:
+        snowflake += 1
+        member = rng.choice(members)
+        user_id = member['user']['id']
+        if kind == 'messages' or not recent_messages:
+            channel_id = rng.choice(text)
+            content = rng.choice(KEYWORD_MESSAGES if rng.random() < KEYWORD_RATE else SAMPLE_MESSAGES)
+            events.append((at, 'MESSAGE_CREATE', {
+                'id': str(snowflake), 'channel_id': channel_id, 'guild_id': str(GUILD_ID),
+                'author': member['user'], 'member': {k: v for k, v in member.items() if k != 'user'},
+                'content': content, 'timestamp': now_iso(), 'edited_timestamp': None, 'tts': False,
+                'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+                'embeds': [], 'pinned': False, 'type': 0,
+            }))
+            recent_messages = (recent_messages + [(str(snowflake), channel_id)])[-200:]
+        elif kind == 'reactions':
+            message_id, channel_id = rng.choice(recent_messages)
+            events.append((at, 'MESSAGE_REACTION_ADD', {
+                'user_id': user_id, 'channel_id': channel_id, 'message_id': message_id,
+                'guild_id': str(GUILD_ID), 'member': member, 'burst': False, 'type': 0,
+                'emoji': {'id': None, 'name': rng.choice(REACTION_EMOJIS)},
+            }))
+        elif kind == 'voice':
+            channel_id = None if user_id in in_voice else rng.choice(voice)
+            if channel_id:
+                in_voice[user_id] = channel_id
+            else:
+                in_voice.pop(user_id)
+            events.append((at, 'VOICE_STATE_UPDATE', {
+                'guild_id': str(GUILD_ID), 'channel_id': channel_id, 'user_id': user_id, 'member': member,
+                'session_id': f'voice-{user_id}', 'deaf': False, 'mute': False, 'self_deaf': False,
+                'self_mute': False, 'self_video': False, 'suppress': False, 'request_to_speak_timestamp': None,
+            }))
+        elif kind == 'interactions':
+            channel_id = rng.choice(text)
+            events.append((at, 'INTERACTION_CREATE', {
+                'id': str(snowflake), 'application_id': str(APPLICATION_ID), 'type': 2,
+                'token': f'token-{snowflake}', 'version': 1, 'guild_id': str(GUILD_ID),
+                'channel_id': channel_id, 'channel': {'id': channel_id, 'type': 0, 'guild_id': str(GUILD_ID)},
+                'member': {**member, 'permissions': '0'}, 'app_permissions': '8', 'locale': 'en-US',
+                'guild_locale': 'en-US', 'entitlements': [], 'authorizing_integration_owners': {},
+                'context': 0, 'attachment_size_limit': 8388608,
+                'data': {'id': str(snowflake), 'name': rng.choice(commands), 'type': 1, 'options': []},
+            }))
+    return events
+
+
+def save_traffic(path, guild, events):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'guild': guild}) + '\n')
+        for at, name, payload in events:
+            f.write(json.dumps({'at': round(at, 6), 't': name, 'd': payload}) + '\n')
+
+
+def load_traffic(path):
+    guild, events = None, []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'guild' in record:
+                guild = record['guild']
+            else:
+                events.append((record['at'], record['t'], record['d']))
+    events.sort(key=lambda event: event[0])
+    return guild, events
+
+
+def event_key(name, payload):
+    """Identify a dispatch so its completion can be matched to the moment it was sent"""
+    if name == 'MESSAGE_CREATE':
+        return ('message', int(payload['id']))
+    if name == 'MESSAGE_REACTION_ADD':
+        return ('reaction', int(payload['message_id']), int(payload['user_id']))
+    if name == 'VOICE_STATE_UPDATE':
+        return ('voice', int(payload['user_id']))
+    if name == 'INTERACTION_CREATE':
+        return ('interaction', int(payload['id']))
+    return None
+
+
+def json_response(data, status=200):
+    # discord.py only parses bodies whose content type is exactly application/json
+    return web.Response(body=json.dumps(data).encode(), status=status, content_type='application/json')
+
+
+def current_rss():
+    """Resident memory of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class FakeDiscord:
+    """Gateway and REST stand-in running on its own event loop thread"""
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.members_by_id = {member['user']['id']: member for member in guild['members']}
+        self.loop = asyncio.new_event_loop()
+        self.ws = None
+        self.sequence = 0
+        self.snowflake = FIRST_SNOWFLAKE + 10 ** 12
+        self.identified = None
+        self.pending = {}  # event key -> perf_counter when the frame was sent
+        self.latencies = defaultdict(list)  # kind -> seconds from send to completion
+        self.sent = Counter()
+        self.send_lag = 0.0
+        self.rest_calls = Counter()
+        self.rss_samples = []
+        self.port = None
+
+    def start(self):
+        """Bind to a free localhost port and serve until the process exits"""
+        ready = threading.Event()
+
+        async def serve():
+            self.identified = asyncio.Event()
+            app = web.Application()
+            app.router.add_get('/', self.gateway)
+            app.router.add_route('*', '/api/v10/{path:.*}', self.rest)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            asyncio.ensure_future(self.sample_memory())
+            ready.set()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(serve())
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name='fake-discord', daemon=True).start()
+        ready.wait()
+        return self
+
+    def call(self, coro):
+        """Run a coroutine on the fake's loop from the bot's loop"""
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def sample_memory(self):
+        while True:
+            self.rss_samples.append(current_rss())
+            await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+    def next_snowflake(self):
+        self.snowflake += 1
+        return str(self.snowflake)
+
+    async def send(self, op, data, event=None):
+        frame = {'op': op, 'd': data, 's': None, 't': event}
+        if event:
+            self.sequence += 1
+            frame['s'] = self.sequence
+        await self.ws.send_str(json.dumps(frame))
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        self.ws = ws
+        await self.send(10, {'heartbeat_interval': HEARTBEAT_INTERVAL})
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            frame = json.loads(msg.data)
+            if frame['op'] == 1:
+                await ws.send_str(json.dumps({'op': 11, 'd': None, 's': None, 't': None}))
+            elif frame['op'] == 2:
+                await self.send(0, {
+                    'v': 10, 'user': user_payload(BOT_USER_ID, 'Aetherius', is_bot=True),
+                    'guilds': [{'id': str(GUILD_ID), 'unavailable': True}], 'session_id': 'loadtest',
+                    'resume_gateway_url': f'ws://127.0.0.1:{self.port}/',
+                    'application': {'id': str(APPLICATION_ID), 'flags': 0},
+                }, 'READY')
+                await self.send(0, self.guild, 'GUILD_CREATE')
+                self.identified.set()
+        return ws
+
+    def message_payload(self, channel_id, body):
+        return {
+            'id': self.next_snowflake(), 'channel_id': str(channel_id), 'guild_id': str(GUILD_ID),
+            'author': user_payload(BOT_USER_ID, 'Aetherius', is_bot=True),
+            'content': body.get('content') or '', 'embeds': body.get('embeds') or [],
+            'components': body.get('components') or [], 'timestamp': now_iso(), 'edited_timestamp': None,
+            'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+            'pinned': False, 'type': 0, 'flags': body.get('flags') or 0,
+        }
+
+    async def rest(self, request):
+        path = request.match_info['path']
+        self.rest_calls[f"{request.method} /{re.sub(r'[0-9]{5,}', '{id}', path)}"] += 1
+        body = await request.json() if request.can_read_body and request.content_type == 'application/json' else {}
+
+        if path == 'users/@me':
+            return json_response(user_payload(BOT_USER_ID, 'Aetherius', is_bot=True))
+        if path == 'oauth2/applications/@me':
+            return json_response({
+                'id': str(APPLICATION_ID), 'name': 'Aetherius', 'icon': None, 'description': '',
+                'bot_public': True, 'bot_require_code_grant': False, 'verify_key': '', 'flags': 0,
+                'owner': user_payload(self.guild['owner_id'], 'owner'),
+            })
+        if path.endswith('/commands') and request.method == 'PUT':
+            return json_response([{**command, 'id': self.next_snowflake(), 'application_id': str(APPLICATION_ID),
+                                       'version': '1'} for command in body])
+
+        if path == f'guilds/{GUILD_ID}/members':
+            # Paged member list for fetch_members, ordered by user id like the real endpoint
+            after = int(request.query.get('after', 0))
+            limit = int(request.query.get('limit', 1000))
+            return json_response([member for member in self.guild['members']
+                                  if int(member['user']['id']) > after][:limit])
+        match = re.fullmatch(rf'guilds/{GUILD_ID}/members/(\d+)', path)
+        if match and request.method == 'GET':
+            member = self.members_by_id.get(match.group(1))
+            if member is None:
+                return json_response({'message': 'Unknown Member', 'code': 10007}, status=404)
+            return json_response(member)
+
+        match = re.fullmatch(r'interactions/(\d+)/[^/]+/callback', path)
+        if match:
+            self.complete(('interaction', int(match.group(1))))
+            data = body.get('data') or {}
+            return json_response({
+                'interaction': {'id': match.group(1), 'type': 2, 'response_message_loading': False,
+                                'response_message_ephemeral': bool(data.get('flags', 0) & 64)},
+                'resource': {'type': body.get('type', 4), 'message': self.message_payload(0, data)},
+            })
+
+        match = re.fullmatch(r'channels/(\d+)/messages(?:/\d+)?', path)
+        if match and request.method in ('POST', 'PATCH'):
+            return json_response(self.message_payload(match.group(1), body))
+        if re.fullmatch(r'webhooks/\d+/[^/]+/messages/@original', path):
+            return json_response(self.message_payload(0, body))
+        return web.Response(status=204)
+
+    def complete(self, key):
+        """Record the end-to-end latency of a dispatch the bot has finished with"""
+        sent = self.pending.pop(key, None)
+        if sent is not None:
+            self.latencies[key[0]].append(time.perf_counter() - sent)
+
+    async def play(self, events):
+        """Send every event at its scheduled offset, tracking how far the sender falls behind"""
+        await self.identified.wait()
+        started = self.loop.time()
+        for at, name, payload in events:
+            delay = started + at - self.loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.send_lag = max(self.send_lag, -delay)
+            key = event_key(name, payload)
+            if key:
+                self.pending[key] = time.perf_counter()
+            await self.send(0, payload, name)
+            self.sent[name] += 1
+        return self.loop.time() - started
+
+
+def instrument_handlers(fake):
+    """Wrap the bot's gateway handlers so each completion is reported back to the fake"""
+    keys = {
+        'on_message': lambda message: ('message', message.id),
+        'on_reaction_add': lambda reaction, user: ('reaction', reaction.message.id, user.id),
+        'on_voice_state_update': lambda member, before, after: ('voice', member.id),
+    }
+    for name, key in keys.items():
+        handler = getattr(bot.bot, name)
+
+        async def wrapped(*args, _handler=handler, _key=key):
+            try:
+                return await _handler(*args)
+            finally:
+                fake.complete(_key(*args))
+
+        setattr(bot.bot, name, wrapped)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def format_ms(seconds):
+    return f"{seconds * 1000:.1f} ms"
+
+
+def print_report(fake, events, elapsed, rss_ready):
+    kinds = {'MESSAGE_CREATE': ('💬', 'message'), 'MESSAGE_REACTION_ADD': ('✨', 'reaction'),
+             'VOICE_STATE_UPDATE': ('🔊', 'voice'), 'INTERACTION_CREATE': ('⚔️', 'interaction')}
+    total = sum(fake.sent.values())
+    print(f"📊 Sent {total:,} events in {elapsed:.1f}s ({total / elapsed:.1f}/s)"
+          f" • sender fell behind by at most {format_ms(fake.send_lag)}")
+    for name, (emoji, kind) in kinds.items():
+        if not fake.sent[name]:
+            continue
+        latencies = fake.latencies[kind]
+        line = f"{emoji} {kind:<12} sent {fake.sent[name]:>7,} • done {len(latencies):>7,}"
+        if latencies:
+            line += (f" • p50 {format_ms(percentile(latencies, 0.5))} • p95 {format_ms(percentile(latencies, 0.95))}"
+                     f" • p99 {format_ms(percentile(latencies, 0.99))} • max {format_ms(max(latencies))}")
+        print(line)
+    if fake.pending:
+        print(f"⚠️ {len(fake.pending):,} event(s) still unfinished when the drain timed out")
+
+    rest_total = sum(fake.rest_calls.values())
+    print(f"🔁 {rest_total:,} REST calls: " + ", ".join(f"{route} {count:,}" for route, count in fake.rest_calls.most_common(6)))
+    samples = fake.rss_samples or [current_rss()]
+    print(f"🧠 RSS {bot.format_bytes(rss_ready)} when ready • peak {bot.format_bytes(max(samples))}"
+          f" • {bot.format_bytes(samples[-1])} at the end")
+    if bot.loop_lag_samples:
+        lags = list(bot.loop_lag_samples)
+        print(f"⏱️ Loop lag p95 {format_ms(percentile(lags, 0.95))} • max {format_ms(max(lags))}"
+              f" • load shedding stage {bot.load_shed_state['stage']}/3")
+
+
+async def run(fake, events, drain):
+    """Log the bot in to the fake, play the traffic and wait for the bot to catch up"""
+    discord.http.Route.BASE = f'http://127.0.0.1:{fake.port}/api/v10'
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(f'ws://127.0.0.1:{fake.port}/')
+    instrument_handlers(fake)
+
+    await bot.bot.login(FAKE_TOKEN)
+    connection = asyncio.create_task(bot.bot.connect(reconnect=False))
+    await asyncio.wait_for(bot.bot.wait_until_ready(), READY_TIMEOUT)
+    rss_ready = current_rss()
+    print(f"✅ Bot ready against fake gateway on port {fake.port}; playing {len(events):,} events...")
+
+    elapsed = await fake.call(fake.play(events))
+    deadline = time.perf_counter() + drain
+    while fake.pending and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+
+    print_report(fake, events, elapsed, rss_ready)
+    await bot.shutdown()
+    connection.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test Aetherius against a local fake Discord")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of synthetic traffic")
+    parser.add_argument('--messages', type=float, default=100, help="messages per second")
+    parser.add_argument('--reactions', type=float, default=10, help="reactions per second")
+    parser.add_argument('--voice', type=float, default=2, help="voice joins/leaves per second")
+    parser.add_argument('--interactions', type=float, default=5, help="slash commands per second")
+    parser.add_argument('--commands', default=DEFAULT_COMMANDS, help="comma-separated slash commands to invoke")
+    parser.add_argument('--members', type=int, default=500)
+    parser.add_argument('--channels', type=int, default=10, help="text channels (plus one voice channel per five)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="write the synthetic traffic to this file for later --replay")
+    parser.add_argument('--replay', help="play a saved traffic file instead of generating one")
+    parser.add_argument('--drain', type=float, default=30, help="seconds to wait for the bot to finish afterwards")
+    args = parser.parse_args()
+
+    if args.replay:
+        guild, events = load_traffic(args.replay)
+        print(f"📥 Loaded {len(events):,} events from {args.replay}")
+    else:
+        guild = build_guild(args.members, args.channels, max(1, args.channels // 5))
+        rates = {'messages': args.messages, 'reactions': args.reactions,
+                 'voice': args.voice, 'interactions': args.interactions}
+        events = generate_traffic(guild, args.duration, rates, args.commands.split(','), args.seed)
+        if args.save:
+            save_traffic(args.save, guild, events)
+            print(f"💾 Saved {len(events):,} events to {args.save}")
+
+    bot.init_db()
+    fake = FakeDiscord(guild).start()
+    asyncio.run(run(fake, events, args.drain))
+
+
+if __name__ == "__main__":
+    main()